@@ -0,0 +1,60 @@
+from pathlib import Path
+import sys
+import timeit
+
+import click
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "cpu"))
+
+from clock import Clock  # noqa: E402
+from decoder import encode_line  # noqa: E402
+from vm import VM  # noqa: E402
+
+
+# One compiled instruction per opcode, in opcode order
+SAMPLES = [
+    ("add.b", "0001d0"),
+    ("sub.b", "0101d0"),
+    ("mul.b", "0201d0"),
+    ("div.b", "0301d0"),
+    ("inc", "04d0"),
+    ("dec", "05d0"),
+    ("noop", "06"),
+    ("move.b", "0705d0"),
+    ("jmp", "0800"),
+    ("jng", "0900"),
+    ("jnz", "0a00"),
+    ("jeq", "0b00"),
+    ("jne", "0c00"),
+    ("halt", "0d"),
+    ("cmp.b", "0e00d0"),
+]
+
+
+@click.command()
+@click.option("--number", default=100000, help="Executions per timing run")
+@click.option("--repeat", default=5, help="Timing runs per instruction, the fastest is reported")
+def main(number, repeat):
+    vm = VM(8, Clock(1, "unlimited"), 16)
+    cpu = vm.cpu
+    total = 0
+
+    print(f"{'Instruction':<12}{'ns/instruction':>16}")
+
+    for name, line in SAMPLES:
+        code = encode_line(line)
+
+        for address, byte in enumerate(code):
+            vm.vram.write(address, byte)
+
+        decoded = cpu.decode(0)
+        cpu.write_data_register(0, 1)
+        seconds = min(timeit.repeat(lambda: cpu.execute_instruction(decoded), number=number, repeat=repeat))
+        total += seconds / number
+        print(f"{name:<12}{seconds / number * 1e9:>16.1f}")
+
+    print(f"{'mean':<12}{total / len(SAMPLES) * 1e9:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+from pathlib import Path
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+import click
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "cpu"))
+
+from assembler import assemble  # noqa: E402
+from clock import Clock  # noqa: E402
+from decoder import encode_line  # noqa: E402
+from image import write_image  # noqa: E402
+from jit import JIT  # noqa: E402
+from tools.compiler import compile_file  # noqa: E402
+from vm import VM  # noqa: E402
+from vram import VRAM  # noqa: E402
+
+
+EXAMPLES = Path(__file__).resolve().parent.parent / "examples"
+
+# One compiled instruction per opcode, grouped by family. A family with more than one line per entry
+# runs them in turn, so pushes are always popped again
+FAMILIES = {
+    "arithmetic": [["0001d0"], ["0101d0"], ["0201d0"], ["0301d0"], ["04d0"], ["05d0"]],
+    "move": [["0705d0"]],
+    "compare": [["0e00d0"]],
+    "branch": [["0800"], ["0900"], ["0a00"], ["0b00"], ["0c00"]],
+    "stack": [["0f05", "10d1"], ["1100", "12"]],
+    "control": [["06"], ["0d"]],
+}
+
+VRAM_SIZES = {"16B": 1, "64KB": 4096, "1MB": 65536}
+
+
+def measure(function, repeat):
+    # Seconds per call, the best of repeat runs as that is the one least disturbed by the rest of the
+    # machine. Each run is long enough to be worth timing, and timeit turns the collector off for it
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def result(name, value, unit, lower_is_better=False):
+    return {"name": name, "value": value, "unit": unit, "lower_is_better": lower_is_better}
+
+
+def synthetic_source(lines):
+    # Straight line arithmetic with a compare and branch every 50 lines, deterministic so runs compare.
+    # Branch targets have to fit in an operand byte, so they all lead back to the top
+    source = ["start: jmp main", "exit:  halt", "main:  move.b #$0,d0"]
+
+    for num in range(lines):
+        if num % 50 == 0:
+            source.append(f"        cmp.b #$5,d0 ; block {num}")
+
+        elif num % 50 == 1:
+            source.append("        jeq exit")
+
+        else:
+            source.append(["        add.b #$1,d0", "        inc d1", "        move.b d0,d2"][num % 3])
+
+    source.append("        halt")
+    return "".join(f"{line}\n" for line in source)
+
+
+def opcodes(repeat):
+    vm = VM(8, Clock(1, "unlimited"), 16)
+    cpu = vm.cpu
+    results = []
+
+    for family, entries in FAMILIES.items():
+        seconds = 0
+        count = 0
+
+        for lines in entries:
+            code = b"".join(encode_line(line) for line in lines)
+            vm.vram.write_bytes(0, code)
+            cpu.decoded.clear()
+            cpu.decode_program(0, len(code))
+            decoded = [cpu.decoded[address] for address in sorted(cpu.decoded)]
+            # Every operand is 1, so repeated division or multiplication leaves d0 alone
+            cpu.write_data_register(0, 1)
+
+            def run():
+                for instruction in decoded:
+                    cpu.execute_instruction(instruction)
+
+            seconds += measure(run, repeat)
+            count += len(decoded)
+
+        results.append(result(f"opcodes.{family}", count / seconds, "instructions/s"))
+
+    return results
+
+
+def loops(repeat):
+    results = []
+
+    for source in sorted(EXAMPLES.joinpath("loops").glob("*.bin")):
+        for jit in (False, True):
+            vm = VM(8, Clock(1, "unlimited"), 16)
+            vm.boot(assemble(source.read_text()))
+
+            if jit:
+                vm.cpu.jit = JIT(vm.cpu)
+
+            snapshot = vm.snapshot()
+            cycles = vm.run().cycles
+
+            def run():
+                vm.restore(snapshot)
+                vm.run()
+
+            name = f"loops.{source.stem}{'.jit' if jit else ''}"
+            results.append(result(name, cycles / measure(run, repeat), "cycles/s"))
+
+    return results
+
+
+def vram(repeat):
+    results = []
+
+    for label, rows in VRAM_SIZES.items():
+        memory = VRAM(rows)
+        size = len(memory)
+        addresses = [num % size for num in range(0, 4096 * 7, 7)]
+        data = bytes(range(256)) * (size // 256) or bytes(range(size))
+
+        def write():
+            for address in addresses:
+                memory.write(address, 0x42)
+
+        def read():
+            for address in addresses:
+                memory.read(address)
+
+        def write_bytes():
+            memory.write_bytes(0, data)
+
+        def read_bytes():
+            with memory.read_bytes(0, size) as view:
+                bytes(view)
+
+        results += [
+            result(f"vram.{label}.write", len(addresses) / measure(write, repeat), "bytes/s"),
+            result(f"vram.{label}.read", len(addresses) / measure(read, repeat), "bytes/s"),
+            result(f"vram.{label}.write_bytes", size / measure(write_bytes, repeat), "bytes/s"),
+            result(f"vram.{label}.read_bytes", size / measure(read_bytes, repeat), "bytes/s"),
+        ]
+
+    return results
+
+
+def boot(repeat):
+    program = assemble(synthetic_source(20000))
+    vm = VM(8, Clock(1, "unlimited"), 4096)
+
+    with tempfile.TemporaryDirectory() as directory:
+        image = Path(directory) / "program.img"
+        write_image(image, program.entry, [(0, program.code)])
+
+        return [
+            result("boot.image", measure(lambda: vm.boot(image), repeat), "s", lower_is_better=True),
+            result("boot.program", measure(lambda: vm.boot(program), repeat), "s", lower_is_better=True),
+        ]
+
+
+def compiler(repeat):
+    lines = 100000
+    source = synthetic_source(lines)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "program.bin"
+        path.write_text(source)
+        output = Path(directory) / "program.out"
+
+        return [
+            result("compiler.assemble", lines / measure(lambda: assemble(source), repeat), "lines/s"),
+            result(
+                "compiler.compile_file",
+                lines / measure(lambda: compile_file(path, output, cache=None), repeat),
+                "lines/s",
+            ),
+        ]
+
+
+SUITES = {
+    "opcodes": opcodes,
+    "loops": loops,
+    "vram": vram,
+    "boot": boot,
+    "compiler": compiler,
+}
+
+
+def metadata():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=Path(__file__).parent
+        ).stdout.strip()
+
+    except OSError:
+        commit = ""
+
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "commit": commit or None,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def compare(results, baseline, threshold):
+    # Relative change against the baseline, signed so that positive is always an improvement
+    previous = {entry["name"]: entry for entry in baseline["benchmarks"]}
+    regressions = []
+
+    for entry in results:
+        if entry["name"] not in previous:
+            continue
+
+        before = previous[entry["name"]]["value"]
+        change = (entry["value"] - before) / before
+
+        if entry["lower_is_better"]:
+            change = -change
+
+        flag = "REGRESSION" if change < -threshold else ""
+        print(f"{entry['name']:<28}{before:>16.4g}{entry['value']:>16.4g}{change:>+10.1%}  {flag}")
+
+        if flag:
+            regressions.append(entry["name"])
+
+    return regressions
+
+
+@click.command()
+@click.option("--suite", "suites", multiple=True, type=click.Choice(list(SUITES)), help="Run only these suites")
+@click.option("--repeat", default=3, help="Timing runs per benchmark, the fastest is reported")
+@click.option("--output", default="benchmark.json", help="Where to save the results as JSON")
+@click.option("--compare", "baseline", default=None, help="A previous results file to compare against")
+@click.option("--threshold", default=0.1, help="Slowdown, as a fraction, reported as a regression by --compare")
+def main(suites, repeat, output, baseline, threshold):
+    results = []
+
+    for name in suites or SUITES:
+        for entry in SUITES[name](repeat):
+            print(f"{entry['name']:<28}{entry['value']:>16.4g} {entry['unit']}")
+            results.append(entry)
+
+    Path(output).write_text(json.dumps({"metadata": metadata(), "benchmarks": results}, indent=2))
+
+    if baseline:
+        print(f"\n{'Benchmark':<28}{'Before':>16}{'After':>16}{'Change':>10}")
+        regressions = compare(results, json.loads(Path(baseline).read_text()), threshold)
+
+        if regressions:
+            exit(f"{len(regressions)} benchmark(s) regressed by more than {threshold:.0%}")
+
+
+if __name__ == '__main__':
+    main()
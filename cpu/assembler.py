@@ -0,0 +1,201 @@
+import re
+
+from constants import ADDRESS_REGISTER_MODE, ADDRESS_REGISTER_PREFIX, DATA_REGISTER_MODE, DATA_REGISTER_PREFIX
+from decoder import encode_operand
+from image import Program
+from instructions import InstructionSet
+from optimizer import Statement, optimize as optimize_statements
+
+
+INSTRUCTION_SET = InstructionSet()
+
+
+class CompileError(Exception):
+    pass
+
+
+# An optional "label:", then an optional mnemonic and whatever operands follow it
+LINE = re.compile(r"^\s*(?:([A-Za-z_]\w*):)?\s*(?:([A-Za-z][\w.]*)\s*(.*?))?\s*$")
+
+
+def tokenize(line, num):
+    # Returns (label, mnemonic, operands), everything after a ";" is a comment
+    match = LINE.match(line.split(";", 1)[0])
+
+    if not match:
+        raise CompileError(f"Syntax error on line {num}: could not read '{line.strip()}'")
+
+    label, mnemonic, operands = match.groups()
+    return label, mnemonic, [operand.strip() for operand in operands.split(",")] if operands else []
+
+
+class Assembler:
+    # Emits code as each line is read. Labels used before they are defined go in a fixup table
+    # and are patched once the whole source has been seen
+    def __init__(self, listing=False):
+        self.code = bytearray()
+        self.labels = {}
+        self.fixups = []
+        # The readable text format needs each instruction as its opcode and operand text
+        self.listing = [] if listing else None
+        # The peephole pass that ran first, if assemble_lines was asked to optimize
+        self.optimizer = None
+
+    def feed(self, line, num):
+        label, mnemonic, operands = tokenize(line, num)
+        self.emit([label] if label else [], mnemonic, operands, num)
+
+    def emit(self, labels, mnemonic, operands, num):
+        for label in labels:
+            if label in self.labels:
+                raise CompileError(f"Duplicate label error on line {num}: '{label}' is already defined")
+
+            self.labels[label] = len(self.code)
+
+        if not mnemonic:
+            return
+
+        instruction = lookup(mnemonic, operands, num)
+        texts = [operand[2:] if operand.startswith("#$") else operand for operand in operands]
+        self.code.append(int(instruction))
+
+        for position, text in enumerate(texts):
+            if instruction.branch:
+                self.fixups.append((len(self.code), text, num, texts, position))
+                self.code.append(0)
+                continue
+
+            self.code.append(operand_byte(text, operands[position], num))
+            self.check_listing(text, operands[position], num)
+
+        if self.listing is not None:
+            self.listing.append((instruction, texts))
+
+    def check_listing(self, text, operand, num):
+        # The text format gives every operand two characters, so it can't hold what the binary one can
+        if self.listing is not None and len(str(text)) > 2:
+            raise CompileError(
+                f"Range error on line {num}: '{operand}' ({text}) is too wide for the text format's two "
+                "character operands, use the binary format"
+            )
+
+    def finish(self):
+        for position, label, num, texts, operand in self.fixups:
+            address = find_label(self.labels, label, num)
+
+            if address > 0xFF:
+                raise CompileError(
+                    f"Range error on line {num}: '{label}' is at {address}, past the last address an operand can hold"
+                )
+
+            self.check_listing(address, label, num)
+            self.code[position] = address
+            texts[operand] = address
+
+        if "start" not in self.labels:
+            raise CompileError("No 'start' label, the CPU would not know where to begin")
+
+        return self.labels["start"]
+
+
+def lookup(mnemonic, operands, num):
+    try:
+        instruction = INSTRUCTION_SET[mnemonic]
+
+    except KeyError as e:
+        raise CompileError(f"Syntax error on line {num}: {e} is not a recognized instruction!")
+
+    if len(operands) != len(instruction) - 1:
+        raise CompileError(
+            f"Syntax error on line {num}: '{mnemonic}' takes {len(instruction) - 1} operand(s), got {len(operands)}"
+        )
+
+    return instruction
+
+
+def operand_byte(text, operand, num):
+    # An operand byte whose high nibble is 0xd or 0xa reads back as a register, so register numbers
+    # must fit the low nibble and immediates are a signed byte outside those two blocks
+    try:
+        byte = encode_operand(text)
+
+    except ValueError:
+        raise CompileError(f"Syntax error on line {num}: '{operand}' is not a valid operand")
+
+    if text.startswith((DATA_REGISTER_PREFIX, ADDRESS_REGISTER_PREFIX)):
+        if not 0 <= int(text[1:]) <= 0x0F:
+            raise CompileError(f"Range error on line {num}: '{operand}', registers are numbered 0 to 15")
+
+    elif not -0x80 <= int(text) <= 0x7F or byte & 0xF0 in (DATA_REGISTER_MODE, ADDRESS_REGISTER_MODE):
+        raise CompileError(
+            f"Range error on line {num}: '{operand}' can't be an immediate, they run from -128 to 127 "
+            "except -96 to -81 and -48 to -33, which would read back as registers"
+        )
+
+    return byte
+
+
+def find_label(labels, label, num):
+    try:
+        return labels[label]
+
+    except KeyError as e:
+        raise CompileError(
+            f"Undefined label error on line {num}: {e} is not a recognized label, "
+            "did you forget to define it or misspell it?"
+        )
+
+
+def parse_lines(lines, progress=None):
+    # Statements for the optimizer, checked as they are read so errors still point at their line.
+    # Labels on a line of their own go with the next instruction
+    statements = []
+    labels = []
+
+    for num, line in enumerate(lines, 1):
+        if progress and num % 10000 == 0:
+            progress(num)
+
+        label, mnemonic, operands = tokenize(line, num)
+
+        if label:
+            labels.append(label)
+
+        if mnemonic:
+            lookup(mnemonic, operands, num)
+            statements.append(Statement(labels, mnemonic, operands, num))
+            labels = []
+
+    if labels:
+        statements.append(Statement(labels, None, [], num))
+
+    return statements
+
+
+def assemble_lines(lines, listing=False, progress=None, optimize=False):
+    # Any iterable of lines works, a file is read one line at a time. progress, when given, is
+    # called with the line number every 10000 lines. With optimize the whole source is parsed first
+    # so the peephole pass can see it, and the assembler then lays out what that leaves
+    assembler = Assembler(listing)
+
+    if optimize:
+        statements, assembler.optimizer = optimize_statements(parse_lines(lines, progress))
+
+        for statement in statements:
+            assembler.emit(*statement)
+
+        return assembler.finish(), assembler
+
+    for num, line in enumerate(lines, 1):
+        if progress and num % 10000 == 0:
+            progress(num)
+
+        assembler.feed(line, num)
+
+    return assembler.finish(), assembler
+
+
+def assemble(source, optimize=False):
+    # Assemble source text, or any iterable of lines, into a Program without touching the disk
+    start, assembler = assemble_lines(source.splitlines() if isinstance(source, str) else source, optimize=optimize)
+    return Program(bytes(assembler.code), start, dict(assembler.labels))
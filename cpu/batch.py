@@ -0,0 +1,86 @@
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import json
+import os
+from pathlib import Path
+import time
+
+import click
+
+from clock import Clock
+from vm import VM
+
+
+def find_programs(patterns):
+    programs = []
+
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        programs.extend(matches if matches else [pattern])
+
+    return programs
+
+
+def run_program(program, registers=8, memory=16):
+    vm = VM(registers, Clock(1, "unlimited"), memory)
+    started = time.perf_counter()
+
+    try:
+        vm.boot(program)
+        state = vm.run()
+
+    except Exception as e:
+        vm.cpu.reason = "error"
+        vm.cpu.error = str(e) or type(e).__name__
+        state = vm.cpu.state()
+
+    return {
+        "program": str(program),
+        **state._asdict(),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def run_batch(programs, workers=None, registers=8, memory=16):
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(programs) // (workers * 4))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(
+            run_program,
+            programs,
+            [registers] * len(programs),
+            [memory] * len(programs),
+            chunksize=chunksize,
+        ))
+
+
+@click.command()
+@click.argument("programs", nargs=-1, required=True)
+@click.option("--workers", default=None, type=int, help="Number of worker processes, defaults to one per core")
+@click.option("--registers", default=8, help="Number of data (and address) registers per VM")
+@click.option("--memory", default=16, help="Rows of memory per VM")
+@click.option("--output", default=None, help="Where to write the JSON results, defaults to stdout")
+def main(programs, workers, registers, memory, output):
+    programs = find_programs(programs)
+    started = time.perf_counter()
+    results = run_batch(programs, workers, registers, memory)
+
+    report = {
+        "programs": len(results),
+        "halted": sum(1 for result in results if result["reason"] == "halt"),
+        "errors": sum(1 for result in results if result["reason"] != "halt"),
+        "cycles": sum(result["cycles"] for result in results),
+        "seconds": time.perf_counter() - started,
+        "results": results,
+    }
+
+    if output:
+        Path(output).write_text(json.dumps(report, indent=2))
+
+    else:
+        click.echo(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@ from enum import Enum
 
 
 class Magnitude(Enum):
+    UNLIMITED = 0
     HZ = 1
     KHZ = 1000
     MHZ = 1000000
@@ -9,15 +10,44 @@ class Magnitude(Enum):
 
 
 class Clock:
-    def __init__(self, speed, magnitude):
+    def __init__(self, speed, magnitude, batch=1, throttle=True):
         self.speed = speed
         self.magnitude = Magnitude[magnitude.upper()]
+        # Number of cycles to run between pacing checks, 1 lets the pacer pick
+        self.batch = max(int(batch), 1)
+        # An unthrottled clock runs as fast as the host allows, but keeps its speed for emulated time
+        self.throttle = throttle
+
+    @property
+    def unlimited(self):
+        return self.magnitude == Magnitude.UNLIMITED or not self.throttle
+
+    @property
+    def frequency(self):
+        # Cycles per second, 0 when the magnitude is unlimited
+        return self.speed * self.magnitude.value
 
     @property
     def tick(self):
-        return 1 / (self.speed * self.magnitude.value)
+        if self.unlimited:
+            return 0
+
+        return 1 / self.frequency
+
+    @property
+    def interval(self):
+        return self.tick * self.batch
 
     def __str__(self):
+        if self.magnitude == Magnitude.UNLIMITED:
+            return "Unlimited"
+
+        elif not self.throttle:
+            return f"{self.speed} {self.magnitude.name} (unthrottled)"
+
+        elif self.batch > 1:
+            return f"{self.speed} {self.magnitude.name} (batch of {self.batch})"
+
         return f"{self.speed} {self.magnitude.name}"
 
     def __repr__(self):
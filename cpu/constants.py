@@ -2,3 +2,12 @@ DATA_REGISTER_PREFIX = "d"
 ADDRESS_REGISTER_PREFIX = "a"
 MEMORY_CELL_PREFIX = "0x"
 DECIMAL_NUMBER_PREFIX = "#$"
+
+# Operand kinds produced by the decoder
+IMMEDIATE = 0
+DATA_REGISTER = 1
+ADDRESS_REGISTER = 2
+
+# High nibble marking a register operand byte, the low nibble is the register number
+DATA_REGISTER_MODE = 0xD0
+ADDRESS_REGISTER_MODE = 0xA0
@@ -1,3 +1,5 @@
+from collections import defaultdict
+import mmap
 import time
 from pathlib import Path
 
@@ -6,28 +8,48 @@ from prettytable import PrettyTable
 from constants import (
     DATA_REGISTER_PREFIX,
     ADDRESS_REGISTER_PREFIX,
-    MEMORY_CELL_PREFIX,
-    DECIMAL_NUMBER_PREFIX
+    DECIMAL_NUMBER_PREFIX,
+    DATA_REGISTER,
+    ADDRESS_REGISTER
 )
 
+from decoder import Decoded, decode, encode_line
 from flags import Flags
+from image import Program, is_image, read_image
 from instructions import InstructionSet
+from pacer import Pacer
 from registers import Register
-from stack import Stack
+from stack import Stack, StackError
+from state import MachineState, Snapshot
+
+
+# Instructions hold no per-execution state, so every CPU can share one set
+INSTRUCTION_SET = InstructionSet()
 
 
 class CPU:
-    def __init__(self, registers, clock, vram):
-        self.data_registers = [Register(f"{DATA_REGISTER_PREFIX}{x}") for x in range(registers)]
-        self.address_registers = [Register(f"{ADDRESS_REGISTER_PREFIX}{x}") for x in range(registers)]
+    def __init__(self, registers, clock, vram, instruction_set=INSTRUCTION_SET):
+        # Plain ints indexed by register number, Register objects are only built to display them
+        self.data_registers = [0] * registers
+        self.address_registers = [0] * registers
         self.start = 0
         self.program_counter = 0
         self.clock = clock
         self.vram = vram
-        self.stop = False
-        self.flags = Flags("z", "n", "v", "c", "e")
+        self.flags = Flags()
         self.stack = Stack()
-        self.instruction_set = InstructionSet()
+        self.instruction_set = instruction_set
+        self.dispatch = self.instruction_set.dispatch
+        self.decoded = {}
+        self.profiler = None
+        self.jit = None
+        # How the last paced run kept to its clock
+        self.pacer = None
+        # Bytes and segments the last boot loaded, for a reporter to show
+        self.loaded = 0
+        self.segments = 0
+        self.vram.watchers.append(self.invalidate)
+        self.reset()
 
     def load_code(self, program_name):
         with Path(program_name).open() as f:
@@ -52,455 +74,395 @@ class CPU:
 
             return int(start), length, instructions
 
-    def boot(self, program_name: str) -> None:
-        instructions = []
-        start, length, instructions = self.load_code(program_name)
-        num = 0
+    def reset(self):
+        # Clear the run state so the CPU can run another program
+        self.stop = False
+        self.cycles = 0
+        # Host time spent running, in nanoseconds
+        self.elapsed = 0
+        self.reason = None
+        self.error = None
+        self.stack.clear()
+        # How often each fused run was taken, by its opcode
+        self.fusion_hits = defaultdict(int)
 
-        for a, seq in enumerate(instructions, 1):
-            for n, x in enumerate([x for x in range(0, len(seq), 2)]):
-                self.vram.write(num, seq[x:x+2])
-                num += 1
-                time.sleep(self.clock.tick)
-                print("\r", f"Loading instruction: {str(a).zfill(len(str(length)))}/{length}...", end="")
+    def boot(self, program_name) -> None:
+        # Either an assembled Program, or the path of a program image or compiled text file
+        self.reset()
 
-        print("\r", f"Loading instruction {length}/{length}... Done!")
-        self.start = start
+        if isinstance(program_name, Program):
+            self.boot_program(program_name)
 
-    def increment_program_counter(self):
-        self.program_counter += 1
+        elif is_image(program_name):
+            self.boot_image(program_name)
 
-    def set_program_counter(self, location):
-        self.program_counter = int(location)
+        else:
+            self.boot_text(program_name)
 
-    def run(self):
         # Since the start memory location is determined, load it into the program counter
-        # and begin the fetch/execute cycle
         self.program_counter = self.start
 
-        while not self.stop:
-            try:
-                # This will need to read the PC and load an instruction from memory
-                self.execute_instruction(self.fetch_instruction())
-                time.sleep(self.clock.tick)
+    def boot_image(self, program_name):
+        # Map the image and copy each segment straight into memory
+        with Path(program_name).open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as image:
+            with memoryview(image) as view:
+                entry, segments = read_image(view)
+
+                for address, offset, length in segments:
+                    with view[offset:offset+length] as data:
+                        self.vram.write_bytes(address, data)
+
+        for address, offset, length in segments:
+            self.decode_program(address, length)
+
+        self.loaded = sum(length for _, _, length in segments)
+        self.segments = len(segments)
+        self.start = entry
+
+    def boot_program(self, program):
+        self.vram.write_bytes(0, program.code)
+        self.decode_program(0, len(program.code))
+        self.loaded = len(program.code)
+        self.segments = 1
+        self.start = program.entry
+
+    def boot_text(self, program_name):
+        start, _, instructions = self.load_code(program_name)
+        code = b"".join(encode_line(seq) for seq in instructions)
+        num = len(code)
+        pacer = Pacer(self.clock)
+        pacer.start()
+        self.vram.write_bytes(0, code)
+
+        if not self.clock.unlimited:
+            # Loading still takes a cycle a byte, slept off in one go rather than per byte
+            pacer.wait(num)
+
+        self.decode_program(0, num)
+        self.loaded = num
+        self.segments = 1
+        self.start = start
 
-            except IndexError as e:
-                print(e)
-                self.halt()
+    def increment_program_counter(self):
+        self.program_counter += 1
 
-        else:
-            self.halt()
+    def set_program_counter(self, location):
+        self.program_counter = int(location)
 
-    def write_data_register(self, location, value):
-        try:
-            self.data_registers[int(location)].value = int(value)
+    def run(self):
+        self.execute_program()
+        return self.state()
 
-        except ValueError:
-            self.data_registers[int(location[1:])].value = int(value)
+    def execute_program(self):
+        # Run the fetch/execute cycle from wherever the program counter is, booting put it at the start
+        started = time.perf_counter_ns()
 
-    def read_data_register(self, location):
         try:
-            return self.data_registers[int(location)].value
-
-        except ValueError:
-            return self.data_registers[int(location[1:])].value
+            if self.profiler:
+                # Profiling measures the program itself, so it always runs unthrottled
+                self.profiler.run(self)
 
-    def write_address_register(self, location_value):
-        self.address_registers[int(location)].value = int(value)
+            elif self.jit and self.clock.unlimited:
+                self.jit.run(self)
 
-    def read_address_register(self, location):
-        return self.address_registers[int(location)].value
-
-    def write_vram(self, location, value):
-        if value.startswith(DECIMAL_NUMBER_PREFIX):
-            self.vram.write(hex(int(location)), int(value[2:]))
-
-    def read_vram(self, location):
-        return self.vram.read(location)
-
-    def fetch_instruction(self):
-        return self.instruction_set[self.read_vram(self.program_counter)]
-
-    def execute_instruction(self, instruction):
-        if instruction == "move.b":
-            instruction.src = str(self.read_vram(self.program_counter+1))
-            instruction.dest = str(self.read_vram(self.program_counter+2))
-
-            if instruction.src.startswith(DATA_REGISTER_PREFIX):
-                if instruction.dest.startswith(DATA_REGISTER_PREFIX):
-                    self.flags.n = int(int(instruction.src[1:]) < 0)
-                    self.flags.z = int(int(instruction.src[1:]) == 0)
-                    self.flags.e = int(int(self.read_data_register(instruction.src)) == int(self.read_vram(instruction.dest[1:])))
-                    self.write_data_register(instruction.dest, instruction.src[1:])
-
-                elif instruction.dest.startswith(ADDRESS_REGISTER_PREFIX):
-                    pass
-
-                elif instruction.dest.startswith(MEMORY_CELL_PREFIX):
-                    pass
-
-            elif instruction.src.startswith(ADDRESS_REGISTER_PREFIX):
-                pass
-
-            else:
-                if instruction.dest.startswith(DATA_REGISTER_PREFIX):
-                    self.flags.n = int(int(instruction.src[1:]) < 0)
-                    self.flags.z = int(int(instruction.src[1:]) == 0)
-                    self.flags.e = int(int(instruction.src) == int(self.read_data_register(instruction.dest)))
-                    self.write_data_register(instruction.dest, instruction.src)
-
-                elif instruction.dest.startswith(ADDRESS_REGISTER_PREFIX):
-                    pass
-
-                elif instruction.dest.startswith(MEMORY_CELL_PREFIX):
-                    pass
-
-            # These flags are cleared irrespective of what happens in a move
-            self.flags.v = 0
-            self.flags.c = 0
-
-            # Move program counter forward
-            for _ in instruction:
-                self.increment_program_counter()
-
-        elif instruction == "halt":
-            # Set the global stop to the fetch/execute cycle can halt
-            self.stop = True
-
-        elif instruction == "noop":
-            for _ in instruction:
-                self.increment_program_counter()
-
-            self.flags.clear()
-
-        elif instruction == "jmp":
-            instruction.label = str(self.read_vram(self.program_counter+1))
-            self.set_program_counter(instruction.label)
-
-        elif instruction == "jnz":
-            if not self.flags.z == 0:
-                instruction.label = str(self.read_vram(self.program_counter+1))
-                self.set_program_counter(instruction.label)
-
-            else:
-                for _ in instruction:
-                    self.increment_program_counter()
-
-        elif instruction == "jng":
-            if self.flags.n < 0:
-                instruction.label = str(self.read_vram(self.program_counter+1))
-                self.set_program_counter(instruction.label)
+            elif self.clock.unlimited:
+                self.run_unthrottled()
 
             else:
-                for _ in instruction:
-                    self.increment_program_counter()
+                self.run_paced()
 
-        elif instruction == "jeq":
-            if self.flags.e == 1:
-                instruction.label = str(self.read_vram(self.program_counter+1))
-                self.set_program_counter(instruction.label)
+            self.reason = "halt"
 
-            else:
-                for _ in instruction:
-                    self.increment_program_counter()
+        except Exception as e:
+            self.fault(e)
 
-        elif instruction == "jne":
-            if self.flags.e == 0:
-                instruction.label = str(self.read_vram(self.program_counter+1))
-                self.set_program_counter(instruction.label)
+        finally:
+            self.elapsed += time.perf_counter_ns() - started
 
-            else:
-                for _ in instruction:
-                    self.increment_program_counter()
-
-        elif instruction == "cmp.b":
-            instruction.src = str(self.read_vram(self.program_counter+1))
-            instruction.dest = str(self.read_vram(self.program_counter+2))
-            result = 0
-
-            # If dealing with src data registers
-            if instruction.src.startswith(DATA_REGISTER_PREFIX):
-                if instruction.dest.startswith(DATA_REGISTER_PREFIX):
-                    result = self.read_data_register(instruction.dest) - self.read_data_register(instruction.src)
-                    self.flags.e = int(self.read_data_register(instruction.dest) == self.read_data_register(instruction.src))
-
-                elif instruction.dest.startswith(ADDRESS_REGISTER_PREFIX):
-                    result = self.read_address_register(instruction.dest[1:]) - self.read_data_register(instruction.src)
-                    self.flags.e = int(self.read_address_register(instruction.dest[1:]) == self.read_data_register(instruction.src))
-
-                else:
-                    result = int(instruction.dest) - self.read_data_register(instruction.src)
-
-            # If dealing with src address registers
-            elif instruction.src.startswith(ADDRESS_REGISTER_PREFIX):
-                if instruction.dest.startswith(DATA_REGISTER_PREFIX):
-                    result = self.read_data_register(instruction.dest) - self.read_address_register(instruction.src[1:])
-                    self.flags.e = int(self.read_data_register(instruction.dest) == self.read_data_register(instruction.src))
-
-                elif instruction.dest.startswith(ADDRESS_REGISTER_PREFIX):
-                    result = self.read_address_register(instruction.dest[1:]) - self.read_address_register(instruction.src[1:])
-                    self.flags.e = int(self.read_data_register(instruction.dest) == self.read_data_register(instruction.src))
-
-                else:
-                    result = int(instruction.dest) - self.read_address_register(instruction.src[1:])
-
-            # If dealing with src being a number
-            else:
-                if instruction.dest.startswith(DATA_REGISTER_PREFIX):
-                    result = int(int(self.read_data_register(instruction.dest)) - int(instruction.src))
-                    self.flags.e = int(int(self.read_data_register(instruction.dest)) == int(instruction.src))
-
-                elif instruction.dest.startswith(ADDRESS_REGISTER_PREFIX):
-                    pass
-
-                else:
-                    result = int(instruction.dest) - int(instruction.src)
-                    self.flags.e = int(int(instruction.dest) == int(instruction.src))
-
-            # set ccr flags
-            self.flags.n = int(result < 0)
-            self.flags.z = int(result == 0)
-            self.flags.v = 0
-            self.flags.c = 0
-
-            # Increment program counter
-            for _ in instruction:
-                self.increment_program_counter()
-
-        elif instruction == "add.b":
-            instruction.src = str(self.read_vram(self.program_counter+1))
-            instruction.dest = str(self.read_vram(self.program_counter+2))
-
-            if instruction.src.startswith(DATA_REGISTER_PREFIX):
-                if instruction.dest.startswith(DATA_REGISTER_PREFIX):
-                    total = int(instruction.src) + self.read_data_register(instruction.dest)
-                    self.flags.n = int(total < 0)
-                    self.flags.z = int(total == 0)
-                    self.flags.e = int(int(self.read_vram(instruction.src)) == int(self.read_vram(instruction.dest)))
-                    self.write_data_register(instruction.dest, total)
-
-                elif instruction.dest.startswith(ADDRESS_REGISTER_PREFIX):
-                    pass
-
-                elif instruction.dest.startswith(MEMORY_CELL_PREFIX):
-                    pass
-
-            elif instruction.src.startswith(ADDRESS_REGISTER_PREFIX):
-                pass
-
-            else:
-                if instruction.dest.startswith(DATA_REGISTER_PREFIX):
-                    total = int(instruction.src) + self.read_data_register(instruction.dest)
-                    self.flags.n = int(total < 0)
-                    self.flags.z = int(total == 0)
-                    self.flags.e = int(int(instruction.src) == int(self.read_data_register(instruction.dest)))
-                    self.write_data_register(instruction.dest, total)
-
-                elif instruction.dest.startswith(ADDRESS_REGISTER_PREFIX):
-                    pass
-
-                elif instruction.dest.startswith(MEMORY_CELL_PREFIX):
-                    pass
+    def fault(self, e):
+        # Stop the machine on whatever the guest program raised, however it was being run
+        self.stop = True
 
-            self.flags.v = 0
-            self.flags.c = 0
+        if isinstance(e, StackError):
+            # Overflow and underflow are the guest's own doing, so they get a reason of their own
+            self.reason = e.reason
+            self.error = str(e)
 
-            # Move program counter forward
-            for _ in instruction:
-                self.increment_program_counter()
+        else:
+            # Guest program faults (bad addresses, unknown opcodes, division by zero)
+            self.reason = "error"
+            self.error = f"{type(e).__name__}: {e}"
+
+    def timing(self):
+        # Emulated time is what the cycles take at the clock's speed, whether or not the run was paced to
+        # it, and the effective speed is how fast the host got through them
+        seconds = self.elapsed / 1e9
+        frequency = self.clock.frequency
+
+        return {
+            "cycles": self.cycles,
+            "seconds": seconds,
+            "effective_mhz": self.cycles / seconds / 1e6 if seconds else 0,
+            "emulated_seconds": self.cycles / frequency if frequency else None,
+            "clock_mhz": frequency / 1e6 if frequency else None,
+        }
+
+    def run_unthrottled(self):
+        # No pacing at all, run as fast as the host allows
+        decoded = self.decoded
+        dispatch = self.dispatch
+        cycles = self.cycles
 
-        elif instruction == "inc":
-            instruction.dest = str(self.read_vram(self.program_counter+1))
+        try:
+            while not self.stop:
+                instruction = decoded.get(self.program_counter) or self.decode(self.program_counter)
+                dispatch[instruction.opcode](self, instruction.operands)
+                cycles += instruction.cycles
+
+        finally:
+            self.cycles = cycles
+
+    def run_slice(self, budget):
+        # About budget cycles from wherever the program counter is (the last instruction may take it a
+        # little over), so a scheduler can share the host between machines. Stops and faults are recorded
+        # as in a full run, and the number of cycles run is returned
+        decoded = self.decoded
+        dispatch = self.dispatch
+        cycles = self.cycles
+        limit = cycles + budget
+        started = time.perf_counter_ns()
 
-            # Data register
-            if instruction.dest.startswith(DATA_REGISTER_PREFIX):
-                origin = self.read_data_register(instruction.dest)
-                self.write_data_register(instruction.dest, origin+1)
+        try:
+            while not self.stop and cycles < limit:
+                instruction = decoded.get(self.program_counter) or self.decode(self.program_counter)
+                dispatch[instruction.opcode](self, instruction.operands)
+                cycles += instruction.cycles
 
-            # Address register
-            elif instruction.dest.startswith(DATA_REGISTER_PREFIX):
-                origin = self.read_address_register(instruction.dest)
-                self.write_address_register(instruction.dest, origin+1)
+            if self.stop and self.reason is None:
+                self.reason = "halt"
 
-            # Numbers, doesn't do anything except change CCRs
-            else:
-                origin = instruction.dest
+        except Exception as e:
+            self.fault(e)
 
-            self.flags.z = int(int(origin+1) == 0)
-            self.flags.e = int(origin == origin+1)
-            self.flags.n = int(int(origin+1) < 0)
+        finally:
+            ran = cycles - self.cycles
+            self.cycles = cycles
+            self.elapsed += time.perf_counter_ns() - started
 
-            for _ in instruction:
-                self.increment_program_counter()
+        return ran
 
-        elif instruction == "sub.b":
-            instruction.src = str(self.read_vram(self.program_counter+1))
-            instruction.dest = str(self.read_vram(self.program_counter+2))
+    def run_paced(self):
+        # Run in bursts and let the pacer sleep off any time the burst left in hand, see pacer.py
+        pacer = self.pacer = Pacer(self.clock)
+        burst = pacer.burst
+        decoded = self.decoded
+        dispatch = self.dispatch
+        first = cycles = self.cycles
+        pacer.start()
 
-            if instruction.src.startswith(DATA_REGISTER_PREFIX) and instruction.dest.startswith(DATA_REGISTER_PREFIX):
-                total = self.read_data_register(instruction.dest) - int(instruction.src)
-                self.flags.n = int(total < 0)
-                self.flags.z = int(total == 0)
-                self.flags.e = int(int(self.read_vram(instruction.src)) == int(self.read_vram(instruction.dest)))
-                self.write_data_register(instruction.dest, total)
+        try:
+            while not self.stop:
+                limit = cycles + burst
 
-            elif instruction.src.startswith(DATA_REGISTER_PREFIX) and instruction.dest.startswith(ADDRESS_REGISTER_PREFIX):
-                pass
+                while not self.stop and cycles < limit:
+                    # Read the PC and load the decoded instruction at that address
+                    instruction = decoded.get(self.program_counter) or self.decode(self.program_counter)
+                    dispatch[instruction.opcode](self, instruction.operands)
+                    cycles += instruction.cycles
 
-            elif instruction.src.startswith(DATA_REGISTER_PREFIX) and instruction.dest.startswith(MEMORY_CELL_PREFIX):
-                pass
+                self.cycles = cycles
 
-            elif instruction.src.startswith(ADDRESS_REGISTER_PREFIX):
-                pass
+                if not self.stop:
+                    pacer.wait(cycles - first)
 
-            else:
-                if instruction.dest.startswith(DATA_REGISTER_PREFIX):
-                    total = self.read_data_register(instruction.dest) - int(instruction.src)
-                    self.flags.n = int(total < 0)
-                    self.flags.z = int(total == 0)
-                    self.flags.e = int(int(instruction.src) == int(self.read_data_register(instruction.dest)))
-                    self.write_data_register(instruction.dest, total)
+        finally:
+            self.cycles = cycles
+            pacer.finish(cycles - first)
 
-                elif instruction.dest.startswith(ADDRESS_REGISTER_PREFIX):
-                    pass
+    def register_number(self, location, prefix):
+        # Accepts a register number or a name such as "d0", names are only for callers outside the run loop.
+        # A name has to carry the prefix of the register file it is looked up in
+        if type(location) is str:
+            if not location.startswith(prefix):
+                raise ValueError(f"'{location}' is not a register named {prefix}N")
 
-                elif instruction.dest.startswith(MEMORY_CELL_PREFIX):
-                    pass
+            return int(location[len(prefix):])
 
-            self.flags.v = 0
-            self.flags.c = 0
+        return location
 
-            # Move program counter forward
-            for _ in instruction:
-                self.increment_program_counter()
-
-        elif instruction == "dec":
-            instruction.dest = str(self.read_vram(self.program_counter+1))
+    def write_data_register(self, location, value):
+        self.data_registers[self.register_number(location, DATA_REGISTER_PREFIX)] = int(value)
 
-            # Data register
-            if instruction.dest.startswith(DATA_REGISTER_PREFIX):
-                origin = self.read_data_register(instruction.dest)
-                self.write_data_register(instruction.dest, origin-1)
+    def read_data_register(self, location):
+        return self.data_registers[self.register_number(location, DATA_REGISTER_PREFIX)]
 
-            # Address register
-            elif instruction.dest.startswith(DATA_REGISTER_PREFIX):
-                origin = self.read_address_register(instruction.dest)
-                self.write_address_register(instruction.dest, origin-1)
+    def write_address_register(self, location, value):
+        self.address_registers[self.register_number(location, ADDRESS_REGISTER_PREFIX)] = int(value)
 
-            # Numbers, doesn't do anything except change CCRs
-            else:
-                origin = instruction.dest
+    def read_address_register(self, location):
+        return self.address_registers[self.register_number(location, ADDRESS_REGISTER_PREFIX)]
 
-            self.flags.z = int(int(origin+1) == 0)
-            self.flags.e = int(origin == origin-1)
-            self.flags.n = int(int(origin+1) < 0)
+    def registers(self):
+        return (
+            [Register(f"{DATA_REGISTER_PREFIX}{num}", value) for num, value in enumerate(self.data_registers)],
+            [Register(f"{ADDRESS_REGISTER_PREFIX}{num}", value) for num, value in enumerate(self.address_registers)],
+        )
 
-            for _ in instruction:
-                self.increment_program_counter()
+    def write_vram(self, location, value):
+        if value.startswith(DECIMAL_NUMBER_PREFIX):
+            self.vram.write(hex(int(location)), int(value[2:]))
 
-        elif instruction == "mul.b":
-            instruction.src = str(self.read_vram(self.program_counter+1))
-            instruction.dest = str(self.read_vram(self.program_counter+2))
+    def read_vram(self, location):
+        return self.vram.read(location)
 
-            if instruction.src.startswith(DATA_REGISTER_PREFIX) and instruction.dest.startswith(DATA_REGISTER_PREFIX):
-                total = self.read_data_register(instruction.dest) * int(instruction.src)
-                self.flags.n = int(int(instruction.src) < 0)
-                self.flags.z = int(int(instruction.src) == 0)
-                self.flags.e = int(int(self.read_vram(instruction.src)) == int(self.read_vram(instruction.dest)))
-                self.write_data_register(instruction.dest, total)
+    def read_operand(self, operand):
+        kind, value = operand
 
-            elif instruction.src.startswith(DATA_REGISTER_PREFIX) and instruction.dest.startswith(ADDRESS_REGISTER_PREFIX):
-                pass
+        if kind == DATA_REGISTER:
+            return self.data_registers[value]
 
-            elif instruction.src.startswith(DATA_REGISTER_PREFIX) and instruction.dest.startswith(MEMORY_CELL_PREFIX):
-                pass
+        elif kind == ADDRESS_REGISTER:
+            return self.address_registers[value]
 
-            elif instruction.src.startswith(ADDRESS_REGISTER_PREFIX):
-                pass
+        return value
 
-            else:
-                if instruction.dest.startswith(DATA_REGISTER_PREFIX):
-                    total = self.read_data_register(instruction.dest) * int(instruction.src)
-                    self.flags.n = int(int(instruction.src) < 0)
-                    self.flags.z = int(int(instruction.src) == 0)
-                    self.flags.e = int(self.read_data_register(instruction.dest) == self.read_data_register(instruction.src))
-                    self.write_data_register(instruction.dest, total)
+    def decode(self, address):
+        decoded = decode(self.instruction_set, self.vram, address)
+        self.decoded[address] = decoded
+        return decoded
 
-                elif instruction.dest.startswith(ADDRESS_REGISTER_PREFIX):
-                    pass
+    def decode_program(self, address, length):
+        # Walk the loaded program once so the fetch/execute cycle only ever sees decoded entries. Data
+        # is walked too, and stops it at the first byte that isn't an opcode or the end of memory
+        end = address + length
+        addresses = []
 
-                elif instruction.dest.startswith(MEMORY_CELL_PREFIX):
-                    pass
+        while address < end:
+            try:
+                decoded = self.decode(address)
 
-            self.flags.v = 0
-            self.flags.c = 0
+            except (KeyError, IndexError):
+                break
 
-            # Move program counter forward
-            for _ in instruction:
-                self.increment_program_counter()
+            addresses.append(address)
+            address += decoded.length
 
-        elif instruction == "div.b":
-            instruction.src = str(self.read_vram(self.program_counter+1))
-            instruction.dest = str(self.read_vram(self.program_counter+2))
+        self.fuse(addresses)
 
-            if instruction.src.startswith(DATA_REGISTER_PREFIX) and instruction.dest.startswith(DATA_REGISTER_PREFIX):
-                total = self.read_data_register(instruction.dest) / int(instruction.src)
-                self.flags.n = int(int(instruction.src) < 0)
-                self.flags.z = int(int(instruction.src) == 0)
-                self.flags.e = int(int(self.read_vram(instruction.src)) == int(self.read_vram(instruction.dest)))
-                self.write_data_register(instruction.dest, total)
+    def fuse(self, addresses):
+        # Put a registered fusion in place of the first instruction of every run it matches. Going in
+        # address order means whatever follows an address is still decoded on its own
+        fusions = self.instruction_set.fusions
+        decoded = self.decoded
 
-            elif instruction.src.startswith(DATA_REGISTER_PREFIX) and instruction.dest.startswith(ADDRESS_REGISTER_PREFIX):
-                pass
+        for address in addresses:
+            for fusion in fusions.get(decoded[address].instruction.name, ()):
+                entries = []
+                following = address
 
-            elif instruction.src.startswith(DATA_REGISTER_PREFIX) and instruction.dest.startswith(MEMORY_CELL_PREFIX):
-                pass
+                for name in fusion.mnemonics:
+                    entry = decoded.get(following)
 
-            elif instruction.src.startswith(ADDRESS_REGISTER_PREFIX):
-                pass
+                    if entry is None or entry.instruction.name != name:
+                        break
 
-            else:
-                if instruction.dest.startswith(DATA_REGISTER_PREFIX):
-                    total = self.read_data_register(instruction.dest) / int(instruction.src)
-                    self.flags.n = int(int(instruction.src) < 0)
-                    self.flags.z = int(int(instruction.src) == 0)
-                    self.flags.e = int(self.read_data_register(instruction.dest) == self.read_data_register(instruction.src))
-                    self.write_data_register(instruction.dest, total)
+                    entries.append(entry)
+                    following += entry.length
 
-                elif instruction.dest.startswith(ADDRESS_REGISTER_PREFIX):
-                    pass
+                else:
+                    operands = fusion.operands(entries, following)
+                    cycles = sum(entry.cycles for entry in entries)
+                    decoded[address] = Decoded(
+                        fusion.opcode, fusion, operands, following - address, len(entries), cycles
+                    )
+                    break
+
+    def plain(self, address):
+        # The instruction at address on its own, even where a fusion has taken its place
+        decoded = self.decoded.get(address) or self.decode(address)
+        return decoded if decoded.count == 1 else decode(self.instruction_set, self.vram, address)
+
+    def fusions(self):
+        hits = sorted(self.fusion_hits.items(), key=lambda item: item[1], reverse=True)
+        return {self.instruction_set.opcodes[opcode].name: count for opcode, count in hits}
+
+    def invalidate(self, address, length):
+        # Drop any decoded instruction, or fused run, whose bytes span the written addresses
+        decoded = self.decoded
+        first = address - self.instruction_set.max_length + 1
+        last = address + length
+
+        if last - first > len(decoded):
+            starts = [start for start in decoded if first <= start < last]
 
-                elif instruction.dest.startswith(MEMORY_CELL_PREFIX):
-                    pass
+        else:
+            starts = [start for start in range(first, last) if start in decoded]
 
-            self.flags.v = 0
-            self.flags.c = 0
+        for start in starts:
+            if start + decoded[start].length > address:
+                del decoded[start]
 
-            # Move program counter forward
-            for _ in instruction:
-                self.increment_program_counter()
+    def fetch_instruction(self):
+        try:
+            return self.decoded[self.program_counter]
 
-        else:
-            exit(f"Runtime error: Unrecognised operand '{instruction.name}'")
+        except KeyError:
+            return self.decode(self.program_counter)
 
+    def execute_instruction(self, decoded):
+        self.dispatch[decoded.opcode](self, decoded.operands)
 
     def halt(self):
         self.stop = True
-        print("Halting and displaying machine state.")
-        self.show()
-        self.vram.show()
-        self.flags.show()
-        exit()
+
+    def state(self):
+        data_registers, address_registers = self.registers()
+
+        return MachineState(
+            {register.name: register.value for register in data_registers},
+            {register.name: register.value for register in address_registers},
+            self.flags.as_dict(),
+            self.program_counter,
+            self.stack.pointer,
+            self.cycles,
+            self.reason,
+            self.error,
+        )
+
+    def snapshot(self):
+        return Snapshot(
+            tuple(self.data_registers),
+            tuple(self.address_registers),
+            self.flags.ccr,
+            self.flags.pending,
+            self.program_counter,
+            self.start,
+            self.stack.entries(),
+            self.cycles,
+            self.vram.snapshot(),
+        )
+
+    def restore(self, snapshot):
+        self.reset()
+        self.data_registers[:] = snapshot.data_registers
+        self.address_registers[:] = snapshot.address_registers
+        self.flags.ccr = snapshot.ccr
+        self.flags.pending = snapshot.pending
+        self.program_counter = snapshot.program_counter
+        self.start = snapshot.start
+        self.stack.load(snapshot.stack)
+        self.cycles = snapshot.cycles
+        self.vram.restore(snapshot.pages)
 
     def show(self):
         table = PrettyTable()
         table.field_names = ["Data Register", "Data Value", "Address Register", "Address Value"]
-        for num in range(len(self.data_registers)):
+        for data_register, address_register in zip(*self.registers()):
             table.add_row([
-                self.data_registers[num].name,
-                self.data_registers[num].value,
-                self.address_registers[num].name,
-                self.address_registers[num].value,
+                data_register.name,
+                data_register.value,
+                address_register.name,
+                address_register.value,
             ])
         print(table)
 
@@ -0,0 +1,66 @@
+from collections import namedtuple
+
+from constants import (
+    DATA_REGISTER_PREFIX,
+    ADDRESS_REGISTER_PREFIX,
+    IMMEDIATE,
+    DATA_REGISTER,
+    ADDRESS_REGISTER,
+    DATA_REGISTER_MODE,
+    ADDRESS_REGISTER_MODE
+)
+
+
+# A decoded instruction: the opcode as an integer, the (immutable) instruction it maps to,
+# its operands as (kind, value) pairs, its length in bytes and the clock cycles it takes. A fused run
+# also records how many instructions it stands for, and its operands are whatever the fusion built
+Decoded = namedtuple("Decoded", ["opcode", "instruction", "operands", "length", "count", "cycles"], defaults=[1, 1])
+
+
+def encode_operand(value):
+    # Registers are stored as 0xdN/0xaN, anything else is a (signed) number
+    if value.startswith(DATA_REGISTER_PREFIX):
+        return DATA_REGISTER_MODE | int(value[1:])
+
+    elif value.startswith(ADDRESS_REGISTER_PREFIX):
+        return ADDRESS_REGISTER_MODE | int(value[1:])
+
+    return int(value) & 0xFF
+
+
+def encode_line(line):
+    # A compiled line is a hex opcode followed by two character operands
+    if len(line) % 2:
+        raise ValueError(f"'{line}' is not a hex opcode followed by two character operands")
+
+    return bytes([int(line[:2], 16), *[encode_operand(line[x:x+2]) for x in range(2, len(line), 2)]])
+
+
+def decode_operand(value):
+    mode = value & 0xF0
+
+    if mode == DATA_REGISTER_MODE:
+        return DATA_REGISTER, value & 0x0F
+
+    elif mode == ADDRESS_REGISTER_MODE:
+        return ADDRESS_REGISTER, value & 0x0F
+
+    return IMMEDIATE, value - 0x100 if value & 0x80 else value
+
+
+def decode(instruction_set, vram, address):
+    instruction = instruction_set.opcodes[vram.read(address)]
+
+    if instruction is None:
+        raise KeyError(f"{vram.read(address):02x}")
+
+    length = len(instruction)
+
+    if instruction.branch:
+        # Branch targets are plain addresses rather than operands
+        operands = tuple((IMMEDIATE, vram.read(address + n)) for n in range(1, length))
+
+    else:
+        operands = tuple(decode_operand(vram.read(address + n)) for n in range(1, length))
+
+    return Decoded(int(instruction.code, 16), instruction, operands, length, 1, instruction.cycles)
@@ -1,17 +1,87 @@
 from prettytable import PrettyTable
 
 
+# Bits of the condition code register
+Z = 1
+N = 2
+V = 4
+C = 8
+E = 16
+
+FLAGS = {"z": Z, "n": N, "v": V, "c": C, "e": E}
+
+
+def flag(mask):
+    def get(self):
+        return 1 if self.resolve() & mask else 0
+
+    def set(self, value):
+        self.load(self.resolve() & ~mask | (mask if value else 0))
+
+    return property(get, set)
+
+
 class Flags:
-    def __init__(self, *args):
-        self.flags = []
+    # The flags are packed into one integer, and an instruction only records what they derive from
+    # as (result, left, right, kept bits): they are worked out when something reads them, which
+    # most of the time nothing does
+    def __init__(self):
+        self.ccr = 0
+        self.pending = None
+
+    z = flag(Z)
+    n = flag(N)
+    v = flag(V)
+    c = flag(C)
+    e = flag(E)
+
+    def set_result(self, result, left, right):
+        # N and Z from the result, E when left equals right, V and C cleared
+        self.pending = (result, left, right, 0)
 
-        for arg in args:
-            self.flags.append(arg)
-            setattr(self, arg, 0)
+    def set_step(self, result):
+        # N and Z from the result, E cleared (0 never equals 1) and V and C left alone
+        self.pending = (result, 0, 1, V | C)
+
+    def clear_overflow(self):
+        # Any pending result keeps V and C from the register, so clearing them there is enough
+        self.ccr &= ~(V | C)
+
+    def load(self, ccr):
+        self.ccr = ccr
+        self.pending = None
+
+    def resolve(self):
+        if self.pending is not None:
+            result, left, right, keep = self.pending
+            self.ccr = (
+                (self.ccr & keep)
+                | (Z if result == 0 else 0)
+                | (N if result < 0 else 0)
+                | (E if left == right else 0)
+            )
+            self.pending = None
+
+        return self.ccr
+
+    # Branches test one flag, straight from a pending result when there is one
+    def zero(self):
+        pending = self.pending
+        return pending[0] == 0 if pending is not None else self.ccr & Z != 0
+
+    def negative(self):
+        pending = self.pending
+        return pending[0] < 0 if pending is not None else self.ccr & N != 0
+
+    def equal(self):
+        pending = self.pending
+        return pending[1] == pending[2] if pending is not None else self.ccr & E != 0
 
     def clear(self):
-        for flag in self.flags:
-            setattr(self, flag, 0)
+        self.load(0)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in FLAGS}
 
     def show(self):
         table = PrettyTable()
@@ -0,0 +1,66 @@
+from collections import namedtuple
+import struct
+from pathlib import Path
+
+
+# Image layout (little endian):
+#   header:   magic, version, number of segments, entry point
+#   segments: load address, offset of the data in the file, length of the data
+#   data:     the raw bytes of each segment, in segment table order
+MAGIC = b"NMVM"
+VERSION = 1
+
+HEADER = struct.Struct("<4sHHI")
+SEGMENT = struct.Struct("<III")
+
+
+# An assembled program held in memory: its code (loaded at address 0), entry point and labels
+Program = namedtuple("Program", ["code", "entry", "symbols"])
+
+
+class ImageError(Exception):
+    pass
+
+
+def is_image(path):
+    with Path(path).open("rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def pack_image(entry, segments):
+    offset = HEADER.size + SEGMENT.size * len(segments)
+    image = bytearray(HEADER.pack(MAGIC, VERSION, len(segments), entry))
+
+    for address, data in segments:
+        image += SEGMENT.pack(address, offset, len(data))
+        offset += len(data)
+
+    for _, data in segments:
+        image += data
+
+    return bytes(image)
+
+
+def write_image(path, entry, segments):
+    Path(path).write_bytes(pack_image(entry, segments))
+
+
+def read_image(buffer):
+    if len(buffer) < HEADER.size:
+        raise ImageError("Image is too small to contain a header")
+
+    magic, version, count, entry = HEADER.unpack_from(buffer, 0)
+
+    if magic != MAGIC:
+        raise ImageError("Not a program image")
+
+    elif version != VERSION:
+        raise ImageError(f"Unsupported image version: {version}")
+
+    segments = [SEGMENT.unpack_from(buffer, HEADER.size + SEGMENT.size * num) for num in range(count)]
+
+    for address, offset, length in segments:
+        if offset + length > len(buffer):
+            raise ImageError(f"Segment at {address} runs past the end of the image")
+
+    return entry, segments
@@ -13,3 +13,7 @@ from .jne import InstructionJNE
 from .move import InstructionMoveByte
 from .noop import InstructionNoOp
 from .cmp import InstructionCMPByte
+from .push import InstructionPush
+from .pop import InstructionPop
+from .jsr import InstructionJSR
+from .rts import InstructionRTS
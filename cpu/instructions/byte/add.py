@@ -1,12 +1,26 @@
+from constants import DATA_REGISTER
+
 from .instruction import Instruction
 
 
 class InstructionAddByte(Instruction):
+    cycles = 1
+
     def __init__(self, code):
-        super().__init__("add.b", code)
-        self.src = ""
-        self.dest = ""
-        self.operands = 3
+        super().__init__("add.b", code, operands=3)
+
+    def execute(self, cpu, operands):
+        src, dest = operands
+        value = cpu.read_operand(src)
+
+        if dest[0] == DATA_REGISTER:
+            origin = cpu.read_operand(dest)
+            total = origin + value
+            cpu.flags.set_result(total, value, origin)
+            cpu.data_registers[dest[1]] = total
+
+        else:
+            cpu.flags.clear_overflow()
 
-    def __str__(self):
-        return f"{self.code}{self.src.zfill(2)}{self.dest.zfill(2)}"
+        # Move program counter forward
+        cpu.program_counter += len(self)
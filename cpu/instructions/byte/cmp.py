@@ -2,11 +2,19 @@ from .instruction import Instruction
 
 
 class InstructionCMPByte(Instruction):
+    cycles = 1
+
     def __init__(self, code):
-        super().__init__("cmp.b", code)
-        self.src = ""
-        self.dest = ""
-        self.operands = 3
+        super().__init__("cmp.b", code, operands=3)
+
+    def execute(self, cpu, operands):
+        src, dest = operands
+        value = cpu.read_operand(src)
+        target = cpu.read_operand(dest)
+        result = target - value
+
+        # set ccr flags
+        cpu.flags.set_result(result, target, value)
 
-    def __str__(self):
-        return f"{self.code}{self.src}{self.dest}"
+        # Increment program counter
+        cpu.program_counter += len(self)
@@ -1,11 +1,27 @@
+from constants import DATA_REGISTER, ADDRESS_REGISTER
+
 from .instruction import Instruction
 
 
 class InstructionDecByte(Instruction):
+    cycles = 1
+
     def __init__(self, code):
-        super().__init__("dec", code)
-        self.dest = ""
-        self.operands = 2
+        super().__init__("dec", code, operands=2)
+
+    def execute(self, cpu, operands):
+        dest = operands[0]
+        total = cpu.read_operand(dest) - 1
+
+        # Data register
+        if dest[0] == DATA_REGISTER:
+            cpu.data_registers[dest[1]] = total
+
+        # Address register
+        elif dest[0] == ADDRESS_REGISTER:
+            cpu.address_registers[dest[1]] = total
+
+        # Numbers, don't do anything except change CCRs
+        cpu.flags.set_step(total)
 
-    def __str__(self):
-        return f"{self.code}{self.dest.zfill(2)}"
+        cpu.program_counter += len(self)
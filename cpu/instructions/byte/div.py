@@ -1,12 +1,28 @@
+from constants import DATA_REGISTER
+from flags import Z, N, E
+
 from .instruction import Instruction
 
 
 class InstructionDivByte(Instruction):
+    cycles = 8
+
     def __init__(self, code):
-        super().__init__("div.b", code)
-        self.src = ""
-        self.dest = ""
-        self.operands = 3
+        super().__init__("div.b", code, operands=3)
+
+    def execute(self, cpu, operands):
+        src, dest = operands
+        value = cpu.read_operand(src)
+
+        if dest[0] == DATA_REGISTER:
+            origin = cpu.read_operand(dest)
+            total = origin / value
+            # The quotient is truncated on the way into the register, so Z can't come from it lazily
+            cpu.flags.load((Z if int(total) == 0 else 0) | (N if total < 0 else 0) | (E if value == origin else 0))
+            cpu.data_registers[dest[1]] = int(total)
+
+        else:
+            cpu.flags.clear_overflow()
 
-    def __str__(self):
-        return f"{self.code}{self.src.zfill(2)}{self.dest.zfill(2)}"
+        # Move program counter forward
+        cpu.program_counter += len(self)
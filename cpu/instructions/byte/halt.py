@@ -2,8 +2,11 @@ from .instruction import Instruction
 
 
 class InstructionHalt(Instruction):
+    cycles = 1
+
     def __init__(self, code):
         super().__init__("halt", code)
 
-    def __str__(self):
-        return self.code
+    def execute(self, cpu, operands):
+        # Set the global stop so the fetch/execute cycle can halt
+        cpu.stop = True
@@ -1,10 +1,27 @@
 class Instruction:
-    def __init__(self, name, code):
+    branch = False
+    # Clock cycles taken, which is what pacing and emulated time are measured in
+    cycles = 1
+
+    def __init__(self, name, code, operands=1, length=1):
         self.name = name.lower()
         self.code = f"{code}".zfill(2)
-        self.operands = 1
-        self.length = 1
-        self.loop_count = 0
+        self.operands = operands
+        self.length = length
+
+    def __setattr__(self, name, value):
+        # Instructions are shared between CPUs (and threads), so they can't change once built,
+        # anything that varies per execution belongs in the decoded instruction instead
+        if "length" in self.__dict__:
+            raise AttributeError(f"'{self.name}' instruction is immutable")
+
+        super().__setattr__(name, value)
+
+    def assemble(self, *operands):
+        return f"{self.code}{''.join(f'{operand}'.zfill(2) for operand in operands)}"
+
+    def execute(self, cpu, operands):
+        raise NotImplementedError(f"Runtime error: Unrecognised operand '{self.name}'")
 
     def __len__(self):
         return self.operands
@@ -13,10 +30,7 @@ class Instruction:
         return int(self)
 
     def __int__(self):
-        return self.code
-
-    def __hex__(self):
-        return hex(self)
+        return int(self.code, 16)
 
     def __eq__(self, other):
         if not type(other) == str:
@@ -25,20 +39,7 @@ class Instruction:
         return self.name == other
 
     def __str__(self):
-        return f"{str(hex(int(self.code)))[2:].zfill(2)}"
+        return self.code
 
     def __repr__(self):
-        return f"<Instruction (self.name): {hex(self)}>"
-
-    def __iter__(self):
-        self.loop_count = 0
-        return self
-
-    def __next__(self):
-        if self.loop_count < self.operands:
-            result = self.loop_count
-            self.loop_count += 1
-            return result
-
-        else:
-            raise StopIteration
+        return f"<Instruction ({self.name}): {hex(self)}>"
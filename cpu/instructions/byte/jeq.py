@@ -2,18 +2,15 @@ from .instruction import Instruction
 
 
 class InstructionJEQ(Instruction):
-    def __init__(self, code):
-        super().__init__("jeq", code)
-        self._label = ""
-        self.operands = 2
+    branch = True
+    cycles = 1
 
-    @property
-    def label(self):
-        return self._label
+    def __init__(self, code):
+        super().__init__("jeq", code, operands=2)
 
-    @label.setter
-    def label(self, label):
-        self._label = f"{label}".zfill(2)
+    def execute(self, cpu, operands):
+        if cpu.flags.equal():
+            cpu.program_counter = operands[0][1]
 
-    def __str__(self):
-        return f"{self.code}{self.label}"
+        else:
+            cpu.program_counter += len(self)
@@ -2,18 +2,11 @@ from .instruction import Instruction
 
 
 class InstructionJmp(Instruction):
-    def __init__(self, code):
-        super().__init__("jmp", code)
-        self._label = ""
-        self.operands = 2
-
-    @property
-    def label(self):
-        return self._label
+    branch = True
+    cycles = 1
 
-    @label.setter
-    def label(self, label):
-        self._label = f"{label}".zfill(2)
+    def __init__(self, code):
+        super().__init__("jmp", code, operands=2)
 
-    def __str__(self):
-        return f"{self.code}{self.label}"
+    def execute(self, cpu, operands):
+        cpu.program_counter = operands[0][1]
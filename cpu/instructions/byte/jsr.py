@@ -0,0 +1,14 @@
+from .instruction import Instruction
+
+
+class InstructionJSR(Instruction):
+    branch = True
+    cycles = 3
+
+    def __init__(self, code):
+        super().__init__("jsr", code, operands=2)
+
+    def execute(self, cpu, operands):
+        # Push the address of the next instruction so rts can come back to it
+        cpu.stack.push(cpu.program_counter + len(self))
+        cpu.program_counter = operands[0][1]
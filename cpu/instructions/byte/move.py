@@ -1,12 +1,25 @@
+from constants import DATA_REGISTER
+
 from .instruction import Instruction
 
 
 class InstructionMoveByte(Instruction):
+    cycles = 1
+
     def __init__(self, code):
-        super().__init__("move.b", code)
-        self.src = ""
-        self.dest = ""
-        self.operands = 3
+        super().__init__("move.b", code, operands=3)
+
+    def execute(self, cpu, operands):
+        src, dest = operands
+        value = cpu.read_operand(src)
+
+        if dest[0] == DATA_REGISTER:
+            cpu.flags.set_result(value, value, cpu.read_operand(dest))
+            cpu.data_registers[dest[1]] = value
+
+        else:
+            # V and C are cleared irrespective of what happens in a move
+            cpu.flags.clear_overflow()
 
-    def __str__(self):
-        return f"{self.code}{self.src.zfill(2)}{self.dest.zfill(2)}"
+        # Move program counter forward
+        cpu.program_counter += len(self)
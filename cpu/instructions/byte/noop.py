@@ -2,5 +2,11 @@ from .instruction import Instruction
 
 
 class InstructionNoOp(Instruction):
+    cycles = 1
+
     def __init__(self, code):
         super().__init__("noop", code)
+
+    def execute(self, cpu, operands):
+        cpu.program_counter += len(self)
+        cpu.flags.clear()
@@ -0,0 +1,24 @@
+from constants import DATA_REGISTER, ADDRESS_REGISTER
+
+from .instruction import Instruction
+
+
+class InstructionPop(Instruction):
+    cycles = 2
+
+    def __init__(self, code):
+        super().__init__("pop", code, operands=2)
+
+    def execute(self, cpu, operands):
+        dest = operands[0]
+        value = cpu.stack.pop()
+
+        if dest[0] == DATA_REGISTER:
+            cpu.data_registers[dest[1]] = value
+
+        elif dest[0] == ADDRESS_REGISTER:
+            cpu.address_registers[dest[1]] = value
+
+        # Popping into a number just drops the value
+
+        cpu.program_counter += len(self)
@@ -0,0 +1,12 @@
+from .instruction import Instruction
+
+
+class InstructionPush(Instruction):
+    cycles = 2
+
+    def __init__(self, code):
+        super().__init__("push", code, operands=2)
+
+    def execute(self, cpu, operands):
+        cpu.stack.push(cpu.read_operand(operands[0]))
+        cpu.program_counter += len(self)
@@ -0,0 +1,11 @@
+from .instruction import Instruction
+
+
+class InstructionRTS(Instruction):
+    cycles = 3
+
+    def __init__(self, code):
+        super().__init__("rts", code)
+
+    def execute(self, cpu, operands):
+        cpu.program_counter = cpu.stack.pop()
@@ -0,0 +1,5 @@
+from .fusion import Fusion
+from .compare import FusionCompareBranch
+from .compare import FusionStepCompareBranch
+from .step import FusionDecrementBranch
+from .step import FusionStepJump
@@ -0,0 +1,40 @@
+from .fusion import Fusion
+
+
+class FusionCompareBranch(Fusion):
+    # cmp.b then jeq or jne, compare-and-branch
+    def __init__(self, branch):
+        super().__init__("cmp.b", branch)
+        self.equal = branch == "jeq"
+
+    def operands(self, entries, following):
+        (src, dest), (target,) = entries[0].operands, entries[1].operands
+        return src, dest, target[1], following
+
+    def execute(self, cpu, operands):
+        cpu.fusion_hits[self.opcode] += 1
+        src, dest, target, following = operands
+        value = cpu.read_operand(src)
+        origin = cpu.read_operand(dest)
+        cpu.flags.set_result(origin - value, origin, value)
+        cpu.program_counter = target if (origin == value) == self.equal else following
+
+
+class FusionStepCompareBranch(FusionCompareBranch):
+    # sub.b or dec, then a compare-and-branch. The step runs as it would on its own
+    def __init__(self, step, branch):
+        super().__init__(branch)
+        self.name = f"{step}+{self.name}"
+        self.mnemonics = (step, *self.mnemonics)
+
+    def operands(self, entries, following):
+        return (entries[0].instruction.execute, entries[0].operands, *super().operands(entries[1:], following))
+
+    def execute(self, cpu, operands):
+        step, step_operands, src, dest, target, following = operands
+        step(cpu, step_operands)
+        cpu.fusion_hits[self.opcode] += 1
+        value = cpu.read_operand(src)
+        origin = cpu.read_operand(dest)
+        cpu.flags.set_result(origin - value, origin, value)
+        cpu.program_counter = target if (origin == value) == self.equal else following
@@ -0,0 +1,24 @@
+class Fusion:
+    # A run of instructions executed with a single dispatch. Decoding puts it in place of the first
+    # instruction of each run it matches, the rest stay decoded at their own addresses so jumping
+    # into the middle of a run still works. The opcode is handed out when it is registered
+    def __init__(self, *mnemonics):
+        self.name = "+".join(mnemonics)
+        self.mnemonics = mnemonics
+        self.opcode = None
+
+    def operands(self, entries, following):
+        # Built once at decode time from the decoded instructions, following is the address after the run
+        raise NotImplementedError(f"'{self.name}' fusion can't be decoded")
+
+    def execute(self, cpu, operands):
+        raise NotImplementedError(f"Runtime error: Unrecognised fusion '{self.name}'")
+
+    def __len__(self):
+        return len(self.mnemonics)
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return f"<Fusion ({self.name}): {self.opcode}>"
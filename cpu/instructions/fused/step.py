@@ -0,0 +1,41 @@
+from constants import DATA_REGISTER, ADDRESS_REGISTER
+
+from .fusion import Fusion
+
+
+class FusionDecrementBranch(Fusion):
+    # dec then jnz, decrement-and-branch-unless-zero
+    def __init__(self):
+        super().__init__("dec", "jnz")
+
+    def operands(self, entries, following):
+        return entries[0].operands[0], entries[1].operands[0][1], following
+
+    def execute(self, cpu, operands):
+        cpu.fusion_hits[self.opcode] += 1
+        dest, target, following = operands
+        total = cpu.read_operand(dest) - 1
+
+        if dest[0] == DATA_REGISTER:
+            cpu.data_registers[dest[1]] = total
+
+        elif dest[0] == ADDRESS_REGISTER:
+            cpu.address_registers[dest[1]] = total
+
+        cpu.flags.set_step(total)
+        cpu.program_counter = target if total != 0 else following
+
+
+class FusionStepJump(Fusion):
+    # Any instruction that carries on to the next one, then jmp. It runs as it would on its own
+    def __init__(self, step):
+        super().__init__(step, "jmp")
+
+    def operands(self, entries, following):
+        return entries[0].instruction.execute, entries[0].operands, entries[1].operands[0][1]
+
+    def execute(self, cpu, operands):
+        cpu.fusion_hits[self.opcode] += 1
+        step, step_operands, target = operands
+        step(cpu, step_operands)
+        cpu.program_counter = target
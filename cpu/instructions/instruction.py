@@ -13,6 +13,14 @@ from .byte import InstructionJNE
 from .byte import InstructionNoOp
 from .byte import InstructionMoveByte
 from .byte import InstructionCMPByte
+from .byte import InstructionPush
+from .byte import InstructionPop
+from .byte import InstructionJSR
+from .byte import InstructionRTS
+from .fused import FusionCompareBranch
+from .fused import FusionDecrementBranch
+from .fused import FusionStepCompareBranch
+from .fused import FusionStepJump
 
 
 class InstructionSet:
@@ -32,6 +40,10 @@ class InstructionSet:
         jne = InstructionJNE("0c")
         halt = InstructionHalt("0d")
         cmp_byte = InstructionCMPByte("0e")
+        push = InstructionPush("0f")
+        pop = InstructionPop("10")
+        jsr = InstructionJSR("11")
+        rts = InstructionRTS("12")
 
         self.instructions = {
             f"{add_byte.name}": add_byte,
@@ -78,8 +90,59 @@ class InstructionSet:
 
             f"{cmp_byte.name}": cmp_byte,
             f"{cmp_byte.code}": cmp_byte,
+
+            f"{push.name}": push,
+            f"{push.code}": push,
+
+            f"{pop.name}": pop,
+            f"{pop.code}": pop,
+
+            f"{jsr.name}": jsr,
+            f"{jsr.code}": jsr,
+
+            f"{rts.name}": rts,
+            f"{rts.code}": rts,
         }
 
+        self.max_length = max(len(instruction) for instruction in self.instructions.values())
+
+        # Opcode indexed tables, so decoding and dispatch never compare names
+        self.opcodes = [None] * 256
+        self.dispatch = [self.illegal] * 256
+
+        for instruction in self.instructions.values():
+            self.opcodes[int(instruction.code, 16)] = instruction
+            self.dispatch[int(instruction.code, 16)] = instruction.execute
+
+        # Fusions by the mnemonic they start with, longest first
+        self.fusions = {}
+
+        for branch in ("jeq", "jne"):
+            self.fuse(FusionCompareBranch(branch))
+            self.fuse(FusionStepCompareBranch("sub.b", branch))
+            self.fuse(FusionStepCompareBranch("dec", branch))
+
+        self.fuse(FusionDecrementBranch())
+
+        for step in ("add.b", "sub.b", "mul.b", "move.b", "inc", "dec"):
+            self.fuse(FusionStepJump(step))
+
+    def fuse(self, fusion):
+        # Fused runs take the opcodes after the last byte value, so they can never be read from memory
+        fusion.opcode = len(self.dispatch)
+        self.opcodes.append(fusion)
+        self.dispatch.append(fusion.execute)
+
+        fusions = self.fusions.setdefault(fusion.mnemonics[0], [])
+        fusions.append(fusion)
+        fusions.sort(key=len, reverse=True)
+
+        # Anything decoded within this many bytes before a write may have read from it
+        self.max_length = max(self.max_length, sum(len(self.instructions[name]) for name in fusion.mnemonics))
+
+    def illegal(self, cpu, operands):
+        raise KeyError(f"Runtime error: Unrecognised instruction at {cpu.program_counter}")
+
     def __len__(self):
         return len(self.instructions)
 
@@ -0,0 +1,403 @@
+from collections import namedtuple
+import re
+
+from constants import IMMEDIATE, DATA_REGISTER, ADDRESS_REGISTER
+from flags import FLAGS as MASKS
+
+
+# A translated block: the compiled function, the address ranges it was translated from (so writes
+# can invalidate it) and the generated source for debugging. A function of None means the
+# instruction at that address is always interpreted.
+Block = namedtuple("Block", ["function", "ranges", "source"])
+
+FLAGS = ("z", "n", "v", "c", "e")
+
+# Branch conditions, as expressions over the flag locals
+CONDITIONS = {
+    "jeq": "e == 1",
+    "jne": "e == 0",
+    "jnz": "z == 0",
+    "jng": "n == 1",
+}
+
+# Longest run of instructions to put in one block
+MAX_BLOCK_LENGTH = 256
+
+# Cycles a looping block runs before handing control back to the run loop
+MAX_LOOP_CYCLES = 10000
+
+NAMES = re.compile(r"[a-z]\w*")
+
+
+class Translation:
+    def __init__(self, registers):
+        self.registers = registers
+        self.operations = []
+        self.names = set()
+
+    def operand(self, operand):
+        kind, value = operand
+
+        if kind == DATA_REGISTER:
+            self.names.add(f"d{value}")
+            return f"d{value}"
+
+        elif kind == ADDRESS_REGISTER:
+            self.names.add(f"a{value}")
+            return f"a{value}"
+
+        return repr(value)
+
+    def assign(self, name, expression):
+        if name in FLAGS:
+            self.names.add(name)
+
+        self.operations.append(("assign", name, expression))
+
+    def exit(self, address, count, condition=None):
+        if condition:
+            self.names.add(condition.split(" ")[0])
+
+        self.operations.append(("exit", condition, address, count, self.sink(condition) if condition else []))
+
+    def halt(self, address, count):
+        self.operations.append(("halt", None, address, count, []))
+
+    def loop(self, count, condition=None):
+        if condition:
+            self.names.add(condition.split(" ")[0])
+
+        self.operations.append(("loop", condition, None, count, []))
+
+    def sink(self, condition):
+        # Flags set just before a conditional exit that only the exit needs are computed inside it,
+        # so the path that stays in the block doesn't pay for them
+        read = set(NAMES.findall(condition))
+        sunk = dict.fromkeys(read)
+        assigned = set(read)
+
+        for operation in reversed(self.operations):
+            if operation[0] != "assign":
+                break
+
+            _, name, expression = operation
+
+            if name in FLAGS and name not in sunk:
+                sunk[name] = None if set(NAMES.findall(expression)) & assigned else expression
+
+            assigned.add(name)
+
+        return [(name, expression) for name, expression in reversed(sunk.items()) if expression is not None]
+
+    def translatable(self, decoded):
+        # Registers the CPU doesn't have fault in the interpreter, where the program counter is exact
+        return all(
+            kind == IMMEDIATE or value < self.registers
+            for kind, value in decoded.operands
+        )
+
+    def eliminate_dead_stores(self):
+        # Walk backwards dropping assignments nothing reads before they are overwritten,
+        # most flag updates in straight line code are never looked at
+        live = set(self.names)
+        operations = []
+
+        for operation in reversed(self.operations):
+            if operation[0] == "assign":
+                _, name, expression = operation
+
+                if name not in live:
+                    continue
+
+                live.discard(name)
+                live.update(NAMES.findall(expression))
+
+            else:
+                _, condition, _, _, sunk = operation
+                exiting = set(self.names) - {name for name, _ in sunk}
+
+                for _, expression in sunk:
+                    exiting.update(NAMES.findall(expression))
+
+                # Only a conditional exit can fall through to the code after it
+                live = (live if condition else set()) | exiting | set(NAMES.findall(condition or ""))
+
+            operations.append(operation)
+
+        self.operations = operations[::-1]
+
+
+def translate_move(translation, operands):
+    src, dest = operands
+    value = translation.operand(src)
+
+    if dest[0] == DATA_REGISTER:
+        register = translation.operand(dest)
+        translation.assign("value", value)
+        translation.assign("n", "int(value < 0)")
+        translation.assign("z", "int(value == 0)")
+        translation.assign("e", f"int(value == {register})")
+        translation.assign(register, "value")
+
+    translation.assign("v", "0")
+    translation.assign("c", "0")
+
+
+def translate_cmp(translation, operands):
+    src, dest = operands
+    translation.assign("value", translation.operand(src))
+    translation.assign("target", translation.operand(dest))
+    translation.assign("result", "target - value")
+    translation.assign("e", "int(target == value)")
+    translation.assign("n", "int(result < 0)")
+    translation.assign("z", "int(result == 0)")
+    translation.assign("v", "0")
+    translation.assign("c", "0")
+
+
+def arithmetic(operator):
+    def translate(translation, operands):
+        src, dest = operands
+        value = translation.operand(src)
+
+        if dest[0] == DATA_REGISTER:
+            register = translation.operand(dest)
+            translation.assign("value", value)
+            translation.assign("total", f"{register} {operator} value")
+            translation.assign("n", "int(total < 0)")
+            translation.assign("z", "int(total == 0)")
+            translation.assign("e", f"int(value == {register})")
+            translation.assign(register, "total")
+
+        translation.assign("v", "0")
+        translation.assign("c", "0")
+
+    return translate
+
+
+def step(operator):
+    def translate(translation, operands):
+        dest = operands[0]
+        translation.assign("total", f"{translation.operand(dest)} {operator} 1")
+
+        if dest[0] != IMMEDIATE:
+            translation.assign(translation.operand(dest), "total")
+
+        translation.assign("z", "int(total == 0)")
+        translation.assign("e", "0")
+        translation.assign("n", "int(total < 0)")
+
+    return translate
+
+
+def translate_noop(translation, operands):
+    for flag in FLAGS:
+        translation.assign(flag, "0")
+
+
+# div.b is left to the interpreter, a division by zero has to stop the machine on the right instruction
+TRANSLATORS = {
+    "move.b": translate_move,
+    "cmp.b": translate_cmp,
+    "add.b": arithmetic("+"),
+    "sub.b": arithmetic("-"),
+    "mul.b": arithmetic("*"),
+    "inc": step("+"),
+    "dec": step("-"),
+    "noop": translate_noop,
+}
+
+
+class JIT:
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.blocks = {}
+        self.cpu.vram.watchers.append(self.invalidate)
+
+    def invalidate(self, address, length):
+        end = address + length
+
+        for start in [
+            start for start, block in self.blocks.items()
+            if any(first < end and last > address for first, last in block.ranges)
+        ]:
+            del self.blocks[start]
+
+    def fetch(self, address):
+        try:
+            return self.cpu.plain(address)
+
+        except (KeyError, IndexError):
+            return None
+
+    def translate(self, start):
+        # Follow the code from start: unconditional jumps are followed, conditional branches become
+        # early exits and a jump back to start turns the block into a loop
+        translation = Translation(len(self.cpu.data_registers))
+        ranges = []
+        visited = set()
+        address = start
+        first = start
+        count = 0
+        total = 0
+
+        while True:
+            decoded = self.fetch(address)
+
+            if total == MAX_BLOCK_LENGTH or decoded is None or not translation.translatable(decoded):
+                translation.exit(address, count)
+                break
+
+            name = decoded.instruction.name
+            visited.add(address)
+
+            if name in TRANSLATORS:
+                TRANSLATORS[name](translation, decoded.operands)
+                address += decoded.length
+                count += decoded.cycles
+                total += 1
+
+            elif name == "jmp":
+                ranges.append((first, address + decoded.length))
+                target = decoded.operands[0][1]
+                count += decoded.cycles
+                total += 1
+
+                if target == start:
+                    translation.loop(count)
+                    break
+
+                elif target in visited:
+                    translation.exit(target, count)
+                    break
+
+                address = first = target
+
+            elif name in CONDITIONS:
+                target = decoded.operands[0][1]
+                count += decoded.cycles
+                total += 1
+
+                if target == start:
+                    translation.loop(count, CONDITIONS[name])
+
+                else:
+                    translation.exit(target, count, CONDITIONS[name])
+
+                address += decoded.length
+
+            elif name == "halt":
+                translation.halt(address, count + decoded.cycles)
+                address += decoded.length
+                total += 1
+                break
+
+            else:
+                translation.exit(address, count)
+                break
+
+        if total == 0:
+            # Nothing here can be translated, so the block is a single interpreted instruction
+            return Block(None, [(start, start + (decoded.length if decoded else 1))], None)
+
+        if first != address:
+            ranges.append((first, address))
+
+        translation.eliminate_dead_stores()
+        return self.build(start, ranges, translation)
+
+    def build(self, start, ranges, translation):
+        registers = sorted(name for name in translation.names if name not in FLAGS)
+        flags = [flag for flag in FLAGS if flag in translation.names]
+        looping = any(operation[0] == "loop" for operation in translation.operations)
+
+        def storage(name):
+            return f"{'data' if name[0] == 'd' else 'address'}[{name[1:]}]"
+
+        writeback = [f"{storage(name)} = {name}" for name in registers]
+
+        if flags:
+            # Reading the flags in the prologue resolved them, so the packed register is current
+            untouched = sum(MASKS.values()) & ~sum(MASKS[flag] for flag in flags)
+            packed = [f"flags.ccr & {untouched}"] if untouched else []
+            packed += [f"{flag} << {MASKS[flag].bit_length() - 1}" for flag in flags]
+            writeback.append(f"flags.load({' | '.join(packed)})")
+
+        lines = ["data = cpu.data_registers", "address = cpu.address_registers", "flags = cpu.flags"]
+        lines += [f"{name} = {storage(name)}" for name in registers]
+        lines += [f"{flag} = flags.{flag}" for flag in flags]
+        lines += ["cycles = 0"]
+        indent = ""
+
+        if looping:
+            lines.append("while True:")
+            indent = "    "
+
+        for kind, *operation in translation.operations:
+            if kind == "assign":
+                name, expression = operation
+                lines.append(f"{indent}{name} = {expression}")
+
+            elif kind == "loop":
+                condition, _, count, _ = operation
+                loop = [
+                    f"cycles += {count}",
+                    f"if cycles >= {MAX_LOOP_CYCLES}:",
+                    *[f"    {line}" for line in writeback],
+                    "    cpu.cycles += cycles",
+                    f"    return {start}",
+                ]
+
+                if condition:
+                    lines.append(f"{indent}if {condition}:")
+                    lines += [f"{indent}    {line}" for line in [*loop, "continue"]]
+
+                else:
+                    lines += [f"{indent}{line}" for line in loop]
+
+            else:
+                condition, address, count, sunk = operation
+                exit = [f"{name} = {expression}" for name, expression in sunk]
+                exit += [*writeback, f"cpu.cycles += cycles + {count}", f"return {address}"]
+
+                if kind == "halt":
+                    exit.insert(0, "cpu.stop = True")
+
+                if condition:
+                    lines.append(f"{indent}if {condition}:")
+                    lines += [f"{indent}    {line}" for line in exit]
+
+                else:
+                    lines += [f"{indent}{line}" for line in exit]
+
+        source = f"def block_{start}(cpu):\n" + "".join(f"    {line}\n" for line in lines)
+        namespace = {}
+        exec(compile(source, f"<block {start}>", "exec"), namespace)
+
+        return Block(namespace[f"block_{start}"], ranges, source)
+
+    def run(self, cpu):
+        blocks = self.blocks
+        decoded = cpu.decoded
+        dispatch = cpu.dispatch
+
+        while not cpu.stop:
+            address = cpu.program_counter
+            block = blocks.get(address)
+
+            if block is None:
+                block = blocks[address] = self.translate(address)
+
+            if block.function is None:
+                instruction = decoded.get(address) or cpu.decode(address)
+                dispatch[instruction.opcode](cpu, instruction.operands)
+                cpu.cycles += instruction.cycles
+
+            else:
+                cpu.program_counter = block.function(cpu)
+
+    def __str__(self):
+        return f"Blocks: {len(self.blocks)}"
+
+    def __repr__(self):
+        return f"<JIT: {str(self)}>"
@@ -1,20 +1,89 @@
 import click
 
-from clock import Clock
+from clock import Clock, Magnitude
+from jit import JIT
+from profiler import Profiler
+from reporter import REPORTERS
 from vm import VM
+from vram import MappedVRAM
 
 
 @click.command()
 @click.option("--load", help="The program to load")
-def main(load):
+@click.option("--speed", default=4, help="The clock speed, in units of --magnitude")
+@click.option(
+    "--magnitude",
+    default="hz",
+    type=click.Choice([magnitude.name.lower() for magnitude in Magnitude], case_sensitive=False),
+    help="The clock magnitude, 'unlimited' runs as fast as the host allows",
+)
+@click.option(
+    "--batch",
+    default=1,
+    help="Cycles to run between pacing checks, by default about a millisecond's worth at the clock speed",
+)
+@click.option(
+    "--unthrottled",
+    is_flag=True,
+    help="Run as fast as the host allows, keeping --speed and --magnitude for the emulated time reported",
+)
+@click.option(
+    "--report",
+    default="table",
+    type=click.Choice([*REPORTERS, "none"], case_sensitive=False),
+    help="How to display the machine state once the program stops",
+)
+@click.option("--profile", default=None, help="Profile the run (unthrottled) and save the report to this file")
+@click.option(
+    "--profile-format",
+    default="json",
+    type=click.Choice(["json", "folded"], case_sensitive=False),
+    help="Save the profile as JSON, or as folded stacks for flame graphs",
+)
+@click.option("--jit", is_flag=True, help="Translate basic blocks to Python functions (unlimited clock only)")
+@click.option(
+    "--memory",
+    default=None,
+    type=int,
+    help="Rows of memory, 16 bytes each (default 16, or the size of --memory-file)",
+)
+@click.option("--memory-file", default=None, help="Map memory onto this file, which keeps its contents after the run")
+@click.option("--private", is_flag=True, help="Map --memory-file copy-on-write, leaving the file untouched")
+def main(
+    load, speed, magnitude, batch, unthrottled, report, profile, profile_format, jit, memory, memory_file, private
+):
     registers = 8
-    clock = Clock(4, "hz")
-    memory = 16
+    clock = Clock(speed, magnitude, batch, throttle=not unthrottled)
+    reporter = REPORTERS[report]() if report in REPORTERS else None
+
+    if memory_file:
+        memory = MappedVRAM(memory_file, memory, private)
+
+    elif memory is None:
+        memory = 16
 
     vm = VM(registers, clock, memory)
     print(vm)
     vm.boot(load)
-    vm.run()
+
+    if reporter:
+        reporter.booted(vm)
+
+    if jit:
+        vm.cpu.jit = JIT(vm.cpu)
+
+    if profile:
+        vm.cpu.profiler = Profiler()
+
+    state = vm.run()
+
+    if profile:
+        vm.cpu.profiler.save(profile, profile_format)
+
+    if reporter:
+        reporter.report(vm, state)
+
+    vm.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,251 @@
+from collections import namedtuple
+
+
+# One parsed line of source: the labels on it, then the instruction as written. A statement with no
+# mnemonic only carries labels, for those at the very end of a program
+Statement = namedtuple("Statement", ["labels", "mnemonic", "operands", "num"])
+
+FLAGS = frozenset(["z", "n", "v", "c", "e"])
+
+BRANCH_FLAGS = {"jeq": {"e"}, "jne": {"e"}, "jnz": {"z"}, "jng": {"n"}}
+
+# Where everything left may be read. A halt shows the registers and flags in the machine's final
+# state, and a subroutine call or return hands them over to whoever runs next
+EXITS = {"halt", "jsr", "rts"}
+
+# Instructions that may stop the machine instead, a division by zero or the stack running over or
+# out. Registers and flags are read as they stand there, otherwise the program carries on past them
+FAULTS = {"div.b", "push", "pop"}
+
+# Instructions that only change registers and flags, so they can go once nothing reads what they
+# wrote. div.b can fault and the stack instructions can overflow, so they always stay
+REMOVABLE = {"add.b", "sub.b", "mul.b", "move.b", "inc", "dec", "cmp.b", "noop"}
+
+# Instructions that leave N and Z as the value of their destination, which a compare with zero
+# straight after would only work out again. The flags it would set differently are listed
+COMPARED = {"add.b": {"e"}, "sub.b": {"e"}, "mul.b": {"e"}, "move.b": {"e"}, "inc": {"e", "v", "c"},
+            "dec": {"e", "v", "c"}}
+
+# How far the liveness search goes before giving up and assuming everything is still needed
+MAX_STEPS = 10000
+
+
+def register(operand):
+    return operand if operand[:1] in ("d", "a") and operand[1:].isdigit() else None
+
+
+def immediate(operand):
+    try:
+        return int(operand[2:] if operand.startswith("#$") else operand)
+
+    except ValueError:
+        return None
+
+
+def effects(statement):
+    # (read, written) as sets of register and flag names. move.b reads its destination only to set E,
+    # which live() looks after as it depends on whether E is needed
+    mnemonic = statement.mnemonic
+    registers = [register(operand) for operand in statement.operands]
+
+    if mnemonic in ("add.b", "sub.b", "mul.b", "div.b", "move.b"):
+        src, dest = registers
+        read = {src} - {None}
+
+        if dest is None or dest[0] != "d":
+            return read, {"v", "c"}
+
+        return read | ({dest} if mnemonic != "move.b" else set()), {dest} | FLAGS
+
+    if mnemonic == "cmp.b":
+        return set(registers) - {None}, FLAGS
+
+    if mnemonic in ("inc", "dec"):
+        return set(registers) - {None}, set(registers) - {None} | {"z", "n", "e"}
+
+    if mnemonic == "noop":
+        return set(), FLAGS
+
+    if mnemonic == "push":
+        return set(registers) - {None}, set()
+
+    if mnemonic == "pop":
+        return set(), set(registers) - {None}
+
+    return BRANCH_FLAGS.get(mnemonic, set()), set()
+
+
+class Optimizer:
+    # Peephole rewrites over the whole statement list, repeated until none of them finds anything.
+    # Nothing here knows about addresses: the assembler lays out what is left and resolves the labels
+    def __init__(self, statements):
+        self.statements = list(statements)
+        self.removed = 0
+        self.threaded = 0
+
+    def run(self):
+        changed = True
+
+        while changed:
+            self.index_labels()
+            changed = self.thread_jumps()
+            changed = self.remove_dead() or changed
+
+        return self.statements
+
+    def index_labels(self):
+        self.labels = {label: index for index, statement in enumerate(self.statements) for label in statement.labels}
+
+    def remove(self, dead):
+        # Drop the statements at the dead indexes in one go. Labels on a removed instruction move to the
+        # one after it, a jump there now lands on that
+        statements = []
+        labels = []
+
+        for index, statement in enumerate(self.statements):
+            if index in dead:
+                labels += statement.labels
+                continue
+
+            if labels:
+                statement = statement._replace(labels=labels + statement.labels)
+                labels = []
+
+            statements.append(statement)
+
+        if labels:
+            statements.append(Statement(labels, None, [], self.statements[-1].num))
+
+        self.statements = statements
+        self.removed += len(dead)
+        self.index_labels()
+
+    def thread_jumps(self):
+        # A jump to a jmp goes straight to where that one ends up
+        changed = False
+
+        for index, statement in enumerate(self.statements):
+            if statement.mnemonic not in ("jmp", "jsr") and statement.mnemonic not in BRANCH_FLAGS:
+                continue
+
+            label = target = statement.operands[0]
+            seen = {label}
+
+            while target in self.labels:
+                landing = self.statements[self.labels[target]]
+
+                if landing.mnemonic != "jmp" or landing.operands[0] in seen:
+                    break
+
+                target = landing.operands[0]
+                seen.add(target)
+
+            if target != label:
+                self.statements[index] = statement._replace(operands=[target])
+                self.threaded += 1
+                changed = True
+
+        return changed
+
+    def remove_dead(self):
+        # Every statement is judged against the list as the pass found it. Whatever one removal makes
+        # dead in turn is picked up by the next pass
+        dead = {index for index in range(len(self.statements)) if self.dead(index)}
+
+        if dead:
+            self.remove(dead)
+
+        return bool(dead)
+
+    def dead(self, index):
+        statement = self.statements[index]
+        mnemonic = statement.mnemonic
+
+        # A jump to the very next instruction
+        if mnemonic == "jmp" or mnemonic in BRANCH_FLAGS:
+            return self.labels.get(statement.operands[0]) == index + 1
+
+        if mnemonic not in REMOVABLE:
+            return False
+
+        if mnemonic == "cmp.b" and self.compared(index):
+            return True
+
+        return not self.live(effects(statement)[1], index + 1)
+
+    def compared(self, index):
+        # cmp.b #$0,dN right after something that left N and Z from dN. Only the flags the two
+        # disagree on have to be unused afterwards, and nothing else may jump in between them
+        statement = self.statements[index]
+        src, dest = statement.operands
+
+        if index == 0 or statement.labels or immediate(src) != 0 or register(dest) is None:
+            return False
+
+        previous = self.statements[index - 1]
+
+        if previous.mnemonic not in COMPARED or previous.operands[-1] != dest:
+            return False
+
+        if previous.mnemonic not in ("inc", "dec") and dest[0] != "d":
+            return False
+
+        return not self.live(COMPARED[previous.mnemonic], index + 1)
+
+    def live(self, names, index):
+        # Whether any of the named registers or flags may be read from index onwards, before being
+        # written again. Both ways out of a branch are followed, and anything unknown counts as a read
+        paths = [(index, frozenset(names))]
+        seen = set()
+        steps = 0
+
+        while paths:
+            index, names = paths.pop()
+
+            while names and (index, names) not in seen:
+                seen.add((index, names))
+                steps += 1
+
+                if steps > MAX_STEPS or index >= len(self.statements):
+                    return True
+
+                statement = self.statements[index]
+                mnemonic = statement.mnemonic
+
+                if mnemonic is None:
+                    index += 1
+                    continue
+
+                if mnemonic in EXITS or mnemonic in FAULTS:
+                    return True
+
+                read, written = effects(statement)
+
+                if read & names:
+                    return True
+
+                dest = statement.operands[-1] if statement.operands else None
+
+                if mnemonic == "move.b" and dest in names and dest[0] == "d" and self.live({"e"}, index + 1):
+                    return True
+
+                names = names - written
+
+                if mnemonic == "jmp" or mnemonic in BRANCH_FLAGS:
+                    if statement.operands[0] not in self.labels:
+                        return True
+
+                    if mnemonic != "jmp":
+                        paths.append((index + 1, names))
+
+                    index = self.labels[statement.operands[0]]
+
+                else:
+                    index += 1
+
+        return False
+
+
+def optimize(statements):
+    optimizer = Optimizer(statements)
+    return optimizer.run(), optimizer
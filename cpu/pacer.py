@@ -0,0 +1,68 @@
+import time
+
+
+# Emulated time a burst covers when the clock doesn't set a batch size, in nanoseconds
+BURST = 1000000
+
+# Slack shorter than this is left to build up, sleeping for it would cost more than it saves
+MIN_SLEEP = 200000
+
+# Falling this far behind (a stalled host, or a clock too fast for it) starts the schedule again from
+# now, rather than running flat out until the lost time is made up
+MAX_LAG = 100000000
+
+
+class Pacer:
+    # Keeps a run to its clock against deadlines on the monotonic clock. Every deadline is worked out
+    # from the start of the run rather than the last sleep, so oversleeping and the time taken running
+    # instructions never add up to drift. Instructions run in bursts, and the pacer only sleeps once a
+    # burst has left it far enough ahead of schedule
+    def __init__(self, clock):
+        self.frequency = clock.frequency
+        self.burst = clock.batch if clock.batch > 1 else max(1, int(BURST * self.frequency / 1e9))
+        self.started = None
+        self.base = None
+        self.cycles = 0
+        self.elapsed = 0
+        self.slept = 0
+        self.dropped = 0
+
+    def start(self):
+        self.started = self.base = time.perf_counter_ns()
+
+    def wait(self, cycles):
+        # Called after each burst with the cycles run since start, sleeps off whatever slack there is
+        self.cycles = cycles
+        slack = self.base + cycles * 1e9 / self.frequency - time.perf_counter_ns()
+
+        if slack >= MIN_SLEEP:
+            time.sleep(slack / 1e9)
+            self.slept += slack
+
+        elif slack < -MAX_LAG:
+            self.base -= slack
+            self.dropped -= slack
+
+    def finish(self, cycles):
+        self.cycles = cycles
+        self.elapsed = time.perf_counter_ns() - self.started
+
+    @property
+    def achieved(self):
+        return self.cycles * 1e9 / self.elapsed if self.elapsed else 0
+
+    def report(self):
+        return {
+            "target_hz": self.frequency,
+            "achieved_hz": self.achieved,
+            "cycles": self.cycles,
+            "seconds": self.elapsed / 1e9,
+            "slept_seconds": self.slept / 1e9,
+            "dropped_seconds": self.dropped / 1e9,
+        }
+
+    def __str__(self):
+        return f"Target: {self.frequency:g} Hz | Achieved: {self.achieved:.4g} Hz"
+
+    def __repr__(self):
+        return f"<Pacer: {str(self)}>"
@@ -0,0 +1,101 @@
+from collections import defaultdict
+import json
+import time
+
+
+class Profiler:
+    # Swapped in for the CPU's own run loop when profiling, so an unprofiled run pays nothing for it
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.nanoseconds = defaultdict(int)
+        self.cycles = 0
+        self.elapsed = 0
+        self.instruction_set = None
+
+    def run(self, cpu):
+        self.instruction_set = cpu.instruction_set
+        decoded = cpu.decoded
+        dispatch = cpu.dispatch
+        counts = self.counts
+        nanoseconds = self.nanoseconds
+        clock = time.perf_counter_ns
+        cycles = 0
+        started = clock()
+
+        try:
+            while not cpu.stop:
+                address = cpu.program_counter
+                instruction = decoded.get(address) or cpu.decode(address)
+
+                if instruction.count > 1:
+                    # Profiles are per instruction as written, so fused runs are taken apart again
+                    instruction = cpu.plain(address)
+
+                key = (address, instruction.opcode)
+
+                before = clock()
+                dispatch[instruction.opcode](cpu, instruction.operands)
+                nanoseconds[key] += clock() - before
+                counts[key] += 1
+                cycles += instruction.cycles
+
+        finally:
+            self.cycles += cycles
+            cpu.cycles += cycles
+            self.elapsed += clock() - started
+
+    def name(self, opcode):
+        return self.instruction_set.opcodes[opcode].name
+
+    def opcodes(self):
+        opcodes = {}
+
+        for (address, opcode), count in self.counts.items():
+            entry = opcodes.setdefault(self.name(opcode), {"count": 0, "nanoseconds": 0})
+            entry["count"] += count
+            entry["nanoseconds"] += self.nanoseconds[(address, opcode)]
+
+        return dict(sorted(opcodes.items(), key=lambda item: item[1]["count"], reverse=True))
+
+    def addresses(self):
+        hot = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+
+        return [
+            {
+                "address": address,
+                "instruction": self.name(opcode),
+                "count": count,
+                "nanoseconds": self.nanoseconds[(address, opcode)],
+            }
+            for (address, opcode), count in hot
+        ]
+
+    def report(self):
+        return {
+            "cycles": self.cycles,
+            "nanoseconds": self.elapsed,
+            "opcodes": self.opcodes(),
+            "addresses": self.addresses(),
+        }
+
+    def to_json(self):
+        return json.dumps(self.report(), indent=2)
+
+    def to_folded(self):
+        # One "instruction;address nanoseconds" line per hot address, as flamegraph.pl expects
+        lines = [
+            f"{self.name(opcode)};0x{address:04x} {self.nanoseconds[(address, opcode)]}"
+            for (address, opcode) in sorted(self.counts)
+        ]
+
+        return "".join(f"{line}\n" for line in lines)
+
+    def save(self, path, output_format="json"):
+        with open(path, "w") as f:
+            f.write(self.to_folded() if output_format == "folded" else self.to_json())
+
+    def __str__(self):
+        return f"Cycles: {self.cycles} | Addresses: {len(self.counts)}"
+
+    def __repr__(self):
+        return f"<Profiler: {str(self)}>"
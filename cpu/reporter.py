@@ -0,0 +1,52 @@
+import json
+
+
+class TableReporter:
+    def booted(self, vm):
+        print(f"Loaded {vm.cpu.loaded} byte(s) in {vm.cpu.segments} segment(s)")
+
+    def report(self, vm, state):
+        print(f"Halting and displaying machine state ({state.reason}).")
+
+        if state.error:
+            print(state.error)
+
+        vm.cpu.show()
+        vm.vram.show()
+        vm.cpu.flags.show()
+
+        timing = vm.cpu.timing()
+        print(f"Cycles: {timing['cycles']} in {timing['seconds']:.6f}s ({timing['effective_mhz']:.3f} effective MHz)")
+
+        if timing["emulated_seconds"] is not None:
+            print(f"Emulated time: {timing['emulated_seconds']:.6f}s at {timing['clock_mhz']:g} MHz")
+
+        if vm.cpu.pacer:
+            print(f"Clock: {vm.cpu.pacer}")
+
+        if vm.cpu.fusion_hits:
+            print("Fused: " + ", ".join(f"{name} {count}" for name, count in vm.cpu.fusions().items()))
+
+
+class JSONReporter:
+    def booted(self, vm):
+        # Everything goes in the one document printed at the end
+        pass
+
+    def report(self, vm, state):
+        clock = vm.cpu.pacer.report() if vm.cpu.pacer else None
+        loaded = {"bytes": vm.cpu.loaded, "segments": vm.cpu.segments}
+        report = {
+            **state._asdict(),
+            "loaded": loaded,
+            "fused": vm.cpu.fusions(),
+            "clock": clock,
+            "timing": vm.cpu.timing(),
+        }
+        print(json.dumps(report, indent=2))
+
+
+REPORTERS = {
+    "table": TableReporter,
+    "json": JSONReporter,
+}
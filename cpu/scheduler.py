@@ -0,0 +1,91 @@
+import asyncio
+
+
+# Cycles a machine runs before giving the others a turn
+DEFAULT_SLICE = 1000
+
+# How much emulated time a paced machine runs ahead in one go, in seconds. A fast clock runs a slice
+# at a time, a slow one wakes for each instruction it is due and sleeps on a timer in between
+QUANTUM = 0.01
+
+
+class Scheduler:
+    # Runs many VMs cooperatively as asyncio tasks in one thread. Each VM runs a slice of cycles and
+    # then yields. One with a clock is kept to its rate by sleeping until its next slice is due,
+    # so thousands of slow, mostly idle machines cost no more than a timer each
+    def __init__(self, slice=DEFAULT_SLICE, quantum=QUANTUM):
+        self.slice = max(int(slice), 1)
+        self.quantum = quantum
+        self.tasks = set()
+
+    def budget(self, clock):
+        if clock.unlimited:
+            return self.slice
+
+        return max(1, min(self.slice, int(self.quantum / clock.tick)))
+
+    def submit(self, vm):
+        # Start a booted VM running, the task it returns finishes with its final machine state
+        task = asyncio.get_running_loop().create_task(self.run_vm(vm))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def run_vm(self, vm):
+        loop = asyncio.get_running_loop()
+        clock = vm.cpu.clock
+        budget = self.budget(clock)
+        tick = clock.tick
+        # Slices are due at fixed points on the loop's monotonic clock, so time lost to a late wake up
+        # is made up rather than carried forward
+        deadline = loop.time()
+
+        try:
+            while True:
+                ran = vm.run_slice(budget)
+
+                if vm.cpu.stop:
+                    break
+
+                if clock.unlimited:
+                    await asyncio.sleep(0)
+                    continue
+
+                deadline += ran * tick
+                delay = deadline - loop.time()
+
+                if delay < -self.quantum:
+                    # Too far behind to catch up without a burst, carry on from now instead
+                    deadline -= delay
+
+                await asyncio.sleep(max(0, delay))
+
+        except asyncio.CancelledError:
+            vm.halt()
+            vm.cpu.reason = "cancelled"
+            raise
+
+        return vm.cpu.state()
+
+    async def join(self):
+        # Wait for every VM still running, their states are on the tasks submit returned
+        while self.tasks:
+            await asyncio.gather(*self.tasks)
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def __str__(self):
+        return f"Running: {len(self)} | Slice: {self.slice}"
+
+    def __repr__(self):
+        return f"<Scheduler: {str(self)}>"
+
+
+def run_all(vms, slice=DEFAULT_SLICE):
+    # Run booted VMs to completion together, returning their final states in order
+    async def main():
+        scheduler = Scheduler(slice)
+        return await asyncio.gather(*[scheduler.submit(vm) for vm in vms])
+
+    return asyncio.run(main())
@@ -1,32 +1,52 @@
+class StackError(Exception):
+    reason = "stack"
+
+
+class StackOverflow(StackError):
+    reason = "stack_overflow"
+
+
+class StackUnderflow(StackError):
+    reason = "stack_underflow"
+
+
 class Stack:
+    # Slots are allocated up front, the pointer is the index of the next free one
     def __init__(self, max_size=1000):
         self.max_size = max_size
-        self.stack = []
+        self.slots = [0] * max_size
+        self.pointer = 0
 
     @property
     def top(self):
-        try:
-            return self.stack[-1]
-
-        except IndexError:
-            return None
+        return self.slots[self.pointer - 1] if self.pointer else None
 
     def pop(self):
-        try:
-            return self.stack.pop()
+        if self.pointer == 0:
+            raise StackUnderflow("Pop from an empty stack")
 
-        except IndexError:
-            return None
+        self.pointer -= 1
+        return self.slots[self.pointer]
 
     def push(self, data):
-        if len(self) < self.max_size:
-            self.stack.append(data)
+        if self.pointer == self.max_size:
+            raise StackOverflow(f"Push onto a full stack of {self.max_size}")
+
+        self.slots[self.pointer] = data
+        self.pointer += 1
+
+    def entries(self):
+        return tuple(self.slots[:self.pointer])
+
+    def load(self, entries):
+        self.slots[:len(entries)] = entries
+        self.pointer = len(entries)
 
-        else:
-            raise Exception("Stack Blown")
+    def clear(self):
+        self.pointer = 0
 
     def __len__(self):
-        return len(self.stack)
+        return self.pointer
 
     @property
     def empty(self):
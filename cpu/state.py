@@ -0,0 +1,27 @@
+from collections import namedtuple
+
+
+# What a machine looks like once it stops running, cheap to build and with no rendering attached
+MachineState = namedtuple("MachineState", [
+    "registers",
+    "address_registers",
+    "flags",
+    "program_counter",
+    "stack_pointer",
+    "cycles",
+    "reason",
+    "error",
+])
+
+# Everything needed to put a machine back where it was, memory is a tuple of pages shared between snapshots
+Snapshot = namedtuple("Snapshot", [
+    "data_registers",
+    "address_registers",
+    "ccr",
+    "pending",
+    "program_counter",
+    "start",
+    "stack",
+    "cycles",
+    "pages",
+])
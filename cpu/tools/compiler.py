@@ -1,10 +1,21 @@
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
 from pathlib import Path
-from cpu.instructions import InstructionSet
+import sys
 
 import click
 
+# Share the simulator's modules, which import each other by their bare names
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from assembler import CompileError, assemble, assemble_lines  # noqa: E402,F401
+from image import pack_image  # noqa: E402
+
+# Bump whenever the compiled output for a given source changes, so cached outputs are not reused
+COMPILER_VERSION = "3"
+DEFAULT_CACHE = Path(".cache") / "compiler"
 
-INSTRUCTION_SET = InstructionSet()
 
 class bcolors:
     HEADER = "\033[95m"
@@ -17,191 +28,164 @@ class bcolors:
     UNDERLINE = "\033[4m"
 
 
-def read_lines(lines):
-    return [line.strip() for line in lines if not line.strip() == "" and not line.strip().startswith(";")]
-
-def read_instruction(instruction):
-    match [s for s in instruction.split(" ") if s]:
-        case[label, instruction, args]:
-            return label[:-1], INSTRUCTION_SET[instruction.strip()], args.split(",")
-
-        case[instruction, args]:
-            if instruction.endswith(":"):
-                return instruction.strip()[:-1], INSTRUCTION_SET[args], None
-
-            else:
-                return None, INSTRUCTION_SET[instruction.strip()], args.split(",")
+def progress(message, show_progress):
+    if show_progress:
+        print("\r", message, end="")
 
-        case[instruction]:
-            return None, INSTRUCTION_SET[instruction.strip()], [""]
 
+def assemble_file(f, listing=False, show_progress=False, optimize=False):
+    start, assembler = assemble_lines(
+        f, listing, lambda num: progress(f"Assembling line {num}...", show_progress), optimize
+    )
 
-@click.command()
-@click.option("--input", help="The program to compile", required=True)
-@click.option("--output", help="The name of the output file", required=True)
-def compile(input, output):
-    print(f"Compiling: {input} to {output}...")
-    code = ""
-    offset = 0
-    fn_offset = 0
-    labels = {}
-    instructions = []
+    if show_progress:
+        print("\r", f"{bcolors.OKGREEN}Assembling {len(assembler.code)} byte(s)... Done!{bcolors.ENDC}")
 
-    try:
-        with Path(input).open() as f:
-            code = read_lines(f.readlines())
+        if assembler.optimizer:
+            print(
+                f"Optimized: {assembler.optimizer.removed} instruction(s) removed, "
+                f"{assembler.optimizer.threaded} jump(s) threaded"
+            )
 
-    except FileNotFoundError as ex:
-        error = [
-            f"{bcolors.FAIL}\nCompilation failed!",
-            f"Input File: '{ex.filename}' does not exist"
-        ]
+    return start, assembler
 
-        exit("\n".join(error))
 
-    # First pass to find labels
-    try:
-        for num, instruction in enumerate(code):
-            print("\r", f"Compiling {str(num).zfill(len(str(len(code))))}/{len(code)}...", end="")
-            label, parsed_instruction, args = read_instruction(instruction)
+def render(start, assembler, output_format):
+    if output_format == "binary":
+        return pack_image(start, [(0, bytes(assembler.code))])
 
-            if label:
-                labels[label] = offset
+    instructions = [instruction.assemble(*texts) for instruction, texts in assembler.listing]
+    output = [".DATA", f"START: {start}", f"LENGTH: {len(instructions)}", "", ".CODE", *instructions]
+    return "".join(f"{line}\n" for line in output).encode()
 
-            offset += parsed_instruction.operands * parsed_instruction.length
 
-    except KeyError as e:
-        print(instruction)
-        error = [
-            f"{bcolors.FAIL}\nCompilation failed!",
-            f"Syntax error on line {num+1}: {e} is not a recognized instruction!{bcolors.ENDC}"
-        ]
+def cache_key(input, output_format, optimize=False):
+    variant = f"{output_format}-optimized" if optimize else output_format
+    digest = hashlib.sha256(b"\0".join([COMPILER_VERSION.encode(), variant.encode(), b""]))
 
-        exit("\n".join(error))
+    with Path(input).open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
 
-    print("\r", f"{bcolors.OKGREEN}Compiling {str(num+1).zfill(len(str(len(code))))}/{len(code)}... Done!{bcolors.ENDC}")
+    return digest.hexdigest()
 
-    # Second pass parsing
-    for num, instruction in enumerate(code):
-        # Remember to find comments elsewhere in a line (not the beginning) and grab everything before the ";" character, attempt to use that as an instruction
-        print("\r", f"Linking {str(num).zfill(len(str(len(code))))}/{len(code)}...", end="")
-        label, parsed_instruction, args = read_instruction(instruction)
 
-        if parsed_instruction == "move.b":
-            if args[0].startswith("#$"):
-                parsed_instruction.src = args[0][2:]
+def compile_file(input, output, output_format="binary", cache=DEFAULT_CACHE, show_progress=False, optimize=False):
+    # Returns whether the output was (re)written, unchanged outputs are left alone
+    if not Path(input).is_file():
+        raise CompileError(f"Input File: '{input}' does not exist")
 
-            else:
-                parsed_instruction.src = args[0]
+    cached = Path(cache) / cache_key(input, output_format, optimize) if cache else None
 
-            parsed_instruction.dest = args[1]
-            instructions.append(str(parsed_instruction))
+    if cached and cached.exists():
+        compiled = cached.read_bytes()
 
-        elif parsed_instruction == "add.b":
-            if args[0].startswith("#$"):
-                parsed_instruction.src = args[0][2:]
+    else:
+        with Path(input).open() as f:
+            start, assembler = assemble_file(f, output_format == "text", show_progress, optimize)
 
-            else:
-                parsed_instruction.src = args[0]
+        compiled = render(start, assembler, output_format)
 
-            parsed_instruction.dest = args[1]
-            instructions.append(str(parsed_instruction))
+        if cached:
+            # Write then rename, so parallel jobs never see a partial entry
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            temporary = cached.with_suffix(f".{os.getpid()}.tmp")
+            temporary.write_bytes(compiled)
+            os.replace(temporary, cached)
 
-        elif parsed_instruction == "inc":
-            parsed_instruction.dest = args[0]
-            instructions.append(str(parsed_instruction))
+    output = Path(output)
 
-        elif parsed_instruction == "sub.b":
-            if args[0].startswith("#$"):
-                parsed_instruction.src = args[0][2:]
+    if output.exists() and output.read_bytes() == compiled:
+        return False
 
-            else:
-                parsed_instruction.src = args[0]
+    output.write_bytes(compiled)
+    return True
 
-            parsed_instruction.dest = args[1]
-            instructions.append(str(parsed_instruction))
 
-        elif parsed_instruction == "dec":
-            parsed_instruction.dest = args[0]
-            instructions.append(str(parsed_instruction))
+def compile_job(job):
+    input, output, output_format, cache, optimize = job
 
-        elif parsed_instruction == "div.b":
-            if args[0].startswith("#$"):
-                parsed_instruction.src = args[0][2:]
+    try:
+        return input, compile_file(input, output, output_format, cache, optimize=optimize), None
 
-            else:
-                parsed_instruction.src = args[0]
+    except CompileError as e:
+        return input, False, str(e)
 
-            parsed_instruction.dest = args[1]
-            instructions.append(str(parsed_instruction))
 
-        elif parsed_instruction == "mul.b":
-            if args[0].startswith("#$"):
-                parsed_instruction.src = args[0][2:]
+def compile_directory(directory, output_format="binary", cache=DEFAULT_CACHE, jobs=1, optimize=False):
+    # Every *.bin under the directory is compiled next to itself as *.bin.out
+    inputs = sorted(str(path) for path in Path(directory).rglob("*.bin"))
+    work = [(input, f"{input}.out", output_format, cache, optimize) for input in inputs]
 
-            else:
-                parsed_instruction.src = args[0]
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            return list(executor.map(compile_job, work))
 
-            parsed_instruction.dest = args[1]
-            instructions.append(str(parsed_instruction))
+    return [compile_job(job) for job in work]
 
-        elif parsed_instruction == "halt":
-            instructions.append(str(parsed_instruction))
 
-        elif parsed_instruction == "noop":
-            instructions.append(str(parsed_instruction))
+def fail(message):
+    error = [
+        f"{bcolors.FAIL}\nCompilation failed!",
+        f"{message}{bcolors.ENDC}"
+    ]
 
-        elif parsed_instruction == "jmp":
-            try:
-                parsed_instruction.label = labels[args[0]]
-                instructions.append(str(parsed_instruction))
+    exit("\n".join(error))
 
-            except KeyError as e:
-                error = [
-                    f"{bcolors.FAIL}\nCompilation failed!",
-                    f"Undefined label error on line {num+1}: {e} is not a recognized label, did you forget to define it or misspell it?{bcolors.ENDC}"
-                ]
-                exit("\n".join(error))
 
-        elif parsed_instruction == "cmp.b":
-            if args[0].startswith("#$"):
-                parsed_instruction.src = args[0][2:].zfill(2)
+@click.command()
+@click.option("--input", help="The program to compile")
+@click.option("--output", help="The name of the output file")
+@click.option("--directory", help="Compile every *.bin file under this directory to *.bin.out")
+@click.option("--jobs", default=1, help="Number of processes to compile a directory with")
+@click.option(
+    "--format",
+    "output_format",
+    default="binary",
+    type=click.Choice(["binary", "text"], case_sensitive=False),
+    help="Emit a binary program image, or the readable text format for debugging",
+)
+@click.option("--cache", default=str(DEFAULT_CACHE), help="Directory of cached compiler outputs")
+@click.option("--no-cache", is_flag=True, help="Always compile, ignoring and not updating the cache")
+@click.option(
+    "--optimize",
+    is_flag=True,
+    help="Run peephole rewrites first: jump threading, dead stores and redundant compares",
+)
+def compile(input, output, directory, jobs, output_format, cache, no_cache, optimize):
+    cache = None if no_cache else cache
+
+    if directory:
+        results = compile_directory(directory, output_format, cache, jobs, optimize)
+
+        for path, written, error in results:
+            if error:
+                print(f"{bcolors.FAIL}{path}: {error}{bcolors.ENDC}")
 
             else:
-                parsed_instruction.src = args[0]
-
-            if args[1].startswith("d") or args[1].startswith("a"):
-                parsed_instruction.dest = args[1]
+                print(f"{path}: {'compiled' if written else 'unchanged'}")
 
-            else:
-                parsed_instruction.dest = args[1][2:].zfill(2)
+        failed = sum(1 for _, _, error in results if error)
+        compiled = sum(1 for _, written, _ in results if written)
+        print(f"{bcolors.OKGREEN}Done! {compiled} compiled, {len(results) - compiled - failed} unchanged{bcolors.ENDC}")
 
-            instructions.append(str(parsed_instruction))
+        if failed:
+            fail(f"{failed} file(s) failed to compile")
 
-        elif any([
-                parsed_instruction == "jnz",
-                parsed_instruction == "jng",
-                parsed_instruction == "jeq",
-                parsed_instruction == "jne",
-            ]):
-            parsed_instruction.label = labels[args[0]]
-            instructions.append(str(parsed_instruction))
+        return
 
-        # Update label offset
-        fn_offset += len(parsed_instruction)
+    if not input or not output:
+        fail("Either --input and --output, or --directory, are required")
 
-    print("\r", f"{bcolors.OKGREEN}Linking {str(num+1).zfill(len(str(len(code))))}/{len(code)}... Done!{bcolors.ENDC}")
+    print(f"Compiling: {input} to {output}...")
 
-    with Path(output).open("w+") as f:
-        f.write(f".DATA\n")
-        f.write(f"START: {labels['start']}\n")
-        f.write(f"LENGTH: {len(instructions)}\n\n")
-        f.write(".CODE\n")
+    try:
+        written = compile_file(input, output, output_format, cache, show_progress=True, optimize=optimize)
 
-        for instruction in instructions:
-            f.write(f"{instruction}\n")
+    except CompileError as e:
+        fail(str(e))
 
-    print(f"{bcolors.OKGREEN}Done!{bcolors.ENDC}")
+    print(f"{bcolors.OKGREEN}Done!{'' if written else ' (unchanged)'}{bcolors.ENDC}")
 
 
 if __name__ == '__main__':
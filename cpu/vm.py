@@ -1,22 +1,40 @@
-from cpu import CPU
+from cpu import CPU, INSTRUCTION_SET
 from vram import VRAM
 
 
 class VM:
-    def __init__(self, registers, clock, vram):
-        self.vram = VRAM(vram)
-        self.cpu = CPU(registers, clock, self.vram)
+    def __init__(self, registers, clock, vram, instruction_set=INSTRUCTION_SET):
+        self.registers = registers
+        # Either a number of memory rows, or an already built VRAM such as a MappedVRAM
+        self.vram = vram if isinstance(vram, VRAM) else VRAM(vram)
+        self.cpu = CPU(registers, clock, self.vram, instruction_set)
 
     def boot(self, program):
         self.cpu.boot(program)
 
     def run(self):
-        while not self.cpu.stop:
-            self.cpu.run()
+        return self.cpu.run()
+
+    def run_slice(self, budget):
+        return self.cpu.run_slice(budget)
 
     def halt(self):
         self.cpu.halt()
-        self.cpu.show()
+
+    def snapshot(self):
+        return self.cpu.snapshot()
+
+    def restore(self, snapshot):
+        self.cpu.restore(snapshot)
+
+    def close(self):
+        self.vram.close()
+
+    def fork(self, snapshot=None):
+        # A new machine in the same state, its memory is copied once from pages shared with the snapshot
+        vm = VM(self.registers, self.cpu.clock, self.vram.size, self.cpu.instruction_set)
+        vm.restore(snapshot or self.snapshot())
+        return vm
 
     def __str__(self):
         output = ["NMunro VM", f"CPU: {str(self.cpu)}", f"Memory: {str(self.vram)}"]
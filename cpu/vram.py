@@ -1,69 +1,137 @@
 import math
+import mmap
+import os
+from pathlib import Path
 
 from prettytable import PrettyTable
 
 
-class Cell:
-    def __init__(self, offset, address):
-        self.offset = offset
-        self.address = address
-        self.value = 0
-
-    def __str__(self):
-        return str(self.value)
-
-    def __repr__(self):
-        return f"<Cell: {self.offset}:{self.address}: {str(self)}>"
-
-
 class VRAM:
     BASE_SIZE = 16
     KB_SIZE = 1024
     MB_SIZE = 1024000
+    PAGE_SIZE = 256
 
-    def __init__(self, size=16):
+    def __init__(self, size=16, memory=None):
         self.size = size
-        self.cells = [[Cell(offset, address) for address in range(self.BASE_SIZE)] for offset in range(self.size)]
+        self.memory = bytearray(self.size * self.BASE_SIZE) if memory is None else memory
+        self.watchers = []
+        # The pages of the last snapshot taken or restored, and which pages were written since
+        self.pages = None
+        self.dirty = set()
 
     def write(self, cell, data):
-        if type(cell) == int:
-            cell = hex(cell)
+        if type(cell) == str:
+            cell = int(cell, self.BASE_SIZE)
+
+        # Negative numbers are stored as their two's complement byte
+        self.memory[cell] = data & 0xFF
+        self.dirty.add(cell // self.PAGE_SIZE)
 
-        offset = math.trunc(int(cell, self.BASE_SIZE) / self.BASE_SIZE)
-        address = int(cell, self.BASE_SIZE) % self.BASE_SIZE
-        self.write_byte(offset, address, data)
+        for watcher in self.watchers:
+            watcher(cell, 1)
 
     def write_byte(self, offset, address, data):
-        self.cells[offset][address].value = data
+        self.write(offset * self.BASE_SIZE + address, data)
+
+    def write_bytes(self, address, data):
+        # Any bytes-like data goes in with one slice assignment
+        start = address
+        end = start + len(data)
+
+        if start < 0 or end > len(self.memory):
+            raise IndexError("bytearray index out of range")
+
+        self.memory[start:end] = data
+        self.dirty.update(range(start // self.PAGE_SIZE, (end - 1) // self.PAGE_SIZE + 1))
 
-    def write_bytes(self, offset, address, data):
-        print(data)
+        for watcher in self.watchers:
+            watcher(start, len(data))
 
     def read(self, cell):
-        if type(cell) == int:
-            cell = hex(cell)
+        if type(cell) == str:
+            cell = int(cell, self.BASE_SIZE)
 
-        offset = math.trunc(int(cell, self.BASE_SIZE) / self.BASE_SIZE)
-        address = int(cell, self.BASE_SIZE) % self.BASE_SIZE
-        return self.read_byte(offset, address)
+        return self.memory[cell]
 
     def read_byte(self, offset, address):
-        return self.cells[offset][address].value
+        return self.memory[offset * self.BASE_SIZE + address]
+
+    def read_bytes(self, address, length):
+        # A read only view onto memory rather than a copy, so writes still go through write and
+        # write_bytes. Release it before a mapped memory is closed
+        if address < 0 or address + length > len(self.memory):
+            raise IndexError("bytearray index out of range")
+
+        return memoryview(self.memory)[address:address + length].toreadonly()
+
+    def page(self, number):
+        start = number * self.PAGE_SIZE
+
+        with self.read_bytes(start, min(self.PAGE_SIZE, len(self) - start)) as page:
+            return bytes(page)
+
+    def snapshot(self):
+        # Pages are immutable bytes, so only pages written since the last snapshot are copied and
+        # every other page is shared with it
+        if self.pages is not None and not self.dirty:
+            return self.pages
+
+        if self.pages is None:
+            pages = [self.page(number) for number in range(math.ceil(len(self) / self.PAGE_SIZE))]
+
+        else:
+            pages = list(self.pages)
+
+            for number in self.dirty:
+                pages[number] = self.page(number)
+
+        self.pages = tuple(pages)
+        self.dirty.clear()
+        return self.pages
+
+    def restore(self, pages):
+        count = math.ceil(len(self) / self.PAGE_SIZE)
+
+        if len(pages) != count:
+            raise ValueError(f"Snapshot has {len(pages)} pages, memory has room for {count}")
+
+        # Only pages written since, or that differ from the pages memory was last synced with, are copied
+        if self.pages is None:
+            changed = range(len(pages))
+
+        elif self.pages is pages:
+            changed = sorted(self.dirty)
+
+        else:
+            changed = sorted(self.dirty.union(
+                number for number in range(len(pages)) if pages[number] is not self.pages[number]
+            ))
+
+        for number in changed:
+            self.write_bytes(number * self.PAGE_SIZE, pages[number])
+
+        self.pages = pages
+        self.dirty.clear()
 
     def show(self):
         table = PrettyTable()
         table.field_names = ["Offset", "0", "1", "2", "3", "4", "5", "6", "7", "8", "9", "A", "B", "C", "D", "E", "F"]
 
-        for num, offset in enumerate(self.cells):
-            table.add_row([f"0x{str(num).ljust(2, '0')}", *offset])
+        for num in range(self.size):
+            with self.offset(num) as row:
+                table.add_row([f"0x{num:x}0", *row.hex(" ").split(" ")])
 
         print(table)
 
+    def close(self):
+        pass
+
     def offset(self, number):
-        return self.cells[number]
+        return self.read_bytes(number * self.BASE_SIZE, self.BASE_SIZE)
 
     def __len__(self):
-        return self.size * self.BASE_SIZE
+        return len(self.memory)
 
     def __str__(self):
         if len(self) >= self.MB_SIZE:
@@ -76,4 +144,44 @@ class VRAM:
             return f"Memory: {len(self)} byte(s)"
 
     def __repr__(self):
-        return "<VRAM: {str(self)}>"
+        return f"<VRAM: {str(self)}>"
+
+
+class MappedVRAM(VRAM):
+    # Memory backed by a file, the OS pages it in as it is touched and whatever the program leaves in
+    # it is still there after the run. A private mapping is copy-on-write instead: processes mapping
+    # the same file share its pages until they write to them, and the file itself never changes
+    def __init__(self, path, size=None, private=False):
+        self.path = Path(path)
+        self.private = private
+
+        if not private:
+            self.path.touch(exist_ok=True)
+
+        self.file = self.path.open("rb" if private else "r+b")
+        existing = os.fstat(self.file.fileno()).st_size
+        length = size * self.BASE_SIZE if size else existing
+
+        if length == 0:
+            self.file.close()
+            raise ValueError(f"'{self.path}' is empty, a size is needed to map it")
+
+        if existing < length:
+            if private:
+                self.file.close()
+                raise ValueError(f"'{self.path}' is {existing} byte(s), too small to map {length} privately")
+
+            self.file.truncate(length)
+
+        memory = mmap.mmap(self.file.fileno(), length, access=mmap.ACCESS_COPY if private else mmap.ACCESS_WRITE)
+        super().__init__(length // self.BASE_SIZE, memory)
+
+    def close(self):
+        if self.memory.closed:
+            return
+
+        if not self.private:
+            self.memory.flush()
+
+        self.memory.close()
+        self.file.close()
@@ -1,25 +1,936 @@
 from pathlib import Path
+import asyncio
+import contextlib
+import io
+import re
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
 
-from cpu.clock import Clock
-from cpu.vm import VM
+from click.testing import CliRunner
+
+# The simulator modules import each other by their bare names, just as when running cpu/main.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "cpu"))
+
+from assembler import CompileError, assemble, assemble_lines  # noqa: E402
+from batch import run_batch, run_program  # noqa: E402
+from clock import Clock  # noqa: E402
+from flags import Flags, C, V  # noqa: E402
+from image import ImageError, read_image, write_image  # noqa: E402
+from instructions import InstructionSet  # noqa: E402
+from instructions.fused import Fusion  # noqa: E402
+from jit import JIT  # noqa: E402
+from pacer import Pacer  # noqa: E402
+from profiler import Profiler  # noqa: E402
+from reporter import REPORTERS  # noqa: E402
+from scheduler import Scheduler, run_all  # noqa: E402
+from stack import Stack  # noqa: E402
+from tools.compiler import compile_directory, compile_file  # noqa: E402
+from tools.compiler import compile as compile_program  # noqa: E402
+from vm import VM  # noqa: E402
+from vram import MappedVRAM, VRAM  # noqa: E402
+
+
+EXAMPLES = Path(__file__).resolve().parent.parent / "examples"
+
+MOVE_PROGRAM = ["0701d0", "0702d1", "0703d2", "0704d3", "0705d4", "0706d5", "0707d6", "0708d7", "0d"]
+NOOP_PROGRAM = ["06", "06", "0d"]
+LOOP_PROGRAM = ["0710d0", "0e00d0", "0b13", "0101d0", "0803", "0d"]
+
+
+def write_program(directory, code, start=0):
+    path = Path(directory) / "program.out"
+
+    with path.open("w") as f:
+        f.write(".DATA\n")
+        f.write(f"START: {start}\n")
+        f.write(f"LENGTH: {len(code)}\n\n")
+        f.write(".CODE\n")
+
+        for line in code:
+            f.write(f"{line}\n")
+
+    return path
 
 
 class MainTests(unittest.TestCase):
     def setUp(self):
         registers = 8
-        clock = Clock(4, "hz")
+        clock = Clock(1, "mhz")
         memory = 16
 
         self.vm = VM(registers, clock, memory)
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def boot(self, code, start=0):
+        self.vm.boot(write_program(self.directory.name, code, start))
+
+    def run_vm(self):
+        return self.vm.run()
 
     def test_smoke_test(self):
-        self.vm.boot(Path("../examples/1.bin"))
-        self.vm.run()
+        self.boot(MOVE_PROGRAM)
+        state = self.run_vm()
+        self.assertEqual(list(state.registers.values()), [1, 2, 3, 4, 5, 6, 7, 8])
+        self.assertEqual(state.reason, "halt")
+        self.assertEqual(state.cycles, 9)
 
     def test_basic_noop(self):
-        self.vm.boot(Path("../examples/2.bin"))
+        self.boot(NOOP_PROGRAM)
+        self.run_vm()
+        self.assertEqual(self.vm.cpu.program_counter, 2)
+
+    def test_programs_run_back_to_back(self):
+        for _ in range(3):
+            self.boot(LOOP_PROGRAM)
+            state = self.run_vm()
+            self.assertEqual(state.reason, "halt")
+            self.assertEqual(state.program_counter, 13)
+            self.assertEqual(state.flags["e"], 1)
+
+    def test_fault_stops_the_machine(self):
+        self.boot(["0701d0", "0300d0", "0d"])
+        state = self.run_vm()
+        self.assertEqual(state.reason, "error")
+        self.assertTrue(state.error.startswith("ZeroDivisionError"))
+        self.assertEqual(state.program_counter, 3)
+
+    def test_loop(self):
+        self.boot(LOOP_PROGRAM)
+        self.run_vm()
+        self.assertEqual(self.vm.cpu.read_data_register("d0"), 0)
+        self.assertEqual(self.vm.cpu.flags.e, 1)
+
+    def test_register_names_match_their_file(self):
+        cpu = self.vm.cpu
+        cpu.write_data_register("d3", 7)
+        cpu.write_address_register("a1", 5)
+        self.assertEqual((cpu.read_data_register("d3"), cpu.read_address_register("a1")), (7, 5))
+        self.assertEqual((cpu.read_data_register(3), cpu.read_address_register(1)), (7, 5))
+
+        with self.assertRaises(ValueError):
+            cpu.read_data_register("a3")
+
+        with self.assertRaises(ValueError):
+            cpu.write_address_register("d1", 9)
+
+        self.assertEqual(cpu.data_registers[1], 0)
+
+
+class ClockTests(unittest.TestCase):
+    def test_unlimited_clock_does_not_tick(self):
+        clock = Clock(1, "unlimited")
+        self.assertTrue(clock.unlimited)
+        self.assertEqual(clock.tick, 0)
+
+    def test_batched_clock_interval(self):
+        clock = Clock(4, "khz", batch=100)
+        self.assertFalse(clock.unlimited)
+        self.assertAlmostEqual(clock.interval, 0.025)
+
+    def test_unlimited_clock_runs_program(self):
+        vm = VM(8, Clock(1, "unlimited"), 16)
+
+        with tempfile.TemporaryDirectory() as directory:
+            vm.boot(write_program(directory, LOOP_PROGRAM))
+
+        self.assertEqual(vm.run().registers["d0"], 0)
+
+    def test_paced_boot_sleeps_once(self):
+        vm = VM(8, Clock(100, "hz"), 16)
+
+        with tempfile.TemporaryDirectory() as directory, mock.patch("time.sleep") as sleep:
+            vm.boot(write_program(directory, MOVE_PROGRAM))
+
+        # 25 bytes at 100 Hz
+        self.assertEqual(sleep.call_count, 1)
+        self.assertAlmostEqual(sleep.call_args[0][0], 0.25, places=2)
+        self.assertEqual(vm.vram.read(24), 0x0D)
+
+    def test_paced_run_keeps_to_clock(self):
+        vm = VM(8, Clock(4, "khz"), 16)
+        vm.boot(assemble("start: move.b #$50,d0\nloop: sub.b #$1,d0\n cmp.b #$0,d0\n jne loop\n halt"))
+        state = vm.run()
+        report = vm.cpu.pacer.report()
+
+        self.assertEqual(vm.cpu.pacer.burst, 4)
+        self.assertEqual((report["target_hz"], report["cycles"]), (4000, state.cycles))
+        # 152 instructions at 4 kHz take 38ms, less the last burst which has no sleep after it
+        self.assertGreaterEqual(report["seconds"], 0.036)
+        self.assertLess(report["seconds"], 0.1)
+
+    def test_batch_sets_the_burst(self):
+        clock = Clock(1, "mhz", batch=50)
+        self.assertEqual(clock.frequency, 1000000)
+        self.assertEqual(Pacer(clock).burst, 50)
+        self.assertEqual(Pacer(Clock(1, "mhz")).burst, 1000)
+        self.assertEqual(Pacer(Clock(4, "hz")).burst, 1)
+
+    def test_unthrottled_clock_keeps_its_frequency(self):
+        clock = Clock(4, "mhz", throttle=False)
+        self.assertTrue(clock.unlimited)
+        self.assertEqual(clock.frequency, 4000000)
+
+        vm = VM(8, clock, 16)
+        vm.boot(assemble("start: move.b #$6,d0\n mul.b #$2,d0\n div.b #$3,d0\n halt"))
+        state = vm.run()
+        timing = vm.cpu.timing()
+
+        self.assertEqual(state.cycles, 14)
+        self.assertEqual(timing["cycles"], 14)
+        self.assertAlmostEqual(timing["emulated_seconds"], 14 / 4000000)
+        self.assertIsNone(VM(8, Clock(1, "unlimited"), 16).cpu.timing()["emulated_seconds"])
+
+
+class DecodeTests(unittest.TestCase):
+    def setUp(self):
+        self.vm = VM(8, Clock(1, "mhz"), 16)
+        self.directory = tempfile.TemporaryDirectory()
+        self.vm.boot(write_program(self.directory.name, LOOP_PROGRAM))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_boot_decodes_program(self):
+        decoded = self.vm.cpu.decoded
+        self.assertEqual(sorted(decoded), [0, 3, 6, 8, 11, 13])
+        self.assertEqual(decoded[0].instruction.name, "move.b")
+        self.assertEqual(decoded[0].operands, ((0, 10), (1, 0)))
+        self.assertEqual(decoded[6].operands, ((0, 13),))
+
+    def test_write_invalidates_decoded_instruction(self):
+        self.vm.vram.write(4, 5)
+        self.assertNotIn(3, self.vm.cpu.decoded)
+        self.assertIn(0, self.vm.cpu.decoded)
+        self.assertIn(6, self.vm.cpu.decoded)
+        self.assertEqual(self.vm.cpu.fetch_instruction().instruction.name, "move.b")
+
+        self.vm.cpu.program_counter = 3
+        self.assertEqual(self.vm.cpu.fetch_instruction().operands, ((0, 5), (1, 0)))
+
+    def test_boot_fuses_common_runs(self):
+        decoded = self.vm.cpu.decoded
+        self.assertEqual(decoded[3].instruction.name, "cmp.b+jeq")
+        self.assertEqual((decoded[3].length, decoded[3].count, decoded[3].cycles), (5, 2, 2))
+        self.assertEqual(decoded[8].instruction.name, "sub.b+jmp")
+        # The instructions inside a run are still there for anything jumping to them
+        self.assertEqual(decoded[6].instruction.name, "jeq")
+        self.assertEqual(self.vm.cpu.plain(3).instruction.name, "cmp.b")
+
+        state = self.vm.run()
+        self.assertEqual(state.cycles, 44)
+        self.assertEqual(self.vm.cpu.fusions(), {"cmp.b+jeq": 11, "sub.b+jmp": 10})
+
+    def test_write_inside_a_run_drops_it(self):
+        self.vm.vram.write(7, 6)
+        self.assertNotIn(3, self.vm.cpu.decoded)
+        self.assertIn(0, self.vm.cpu.decoded)
+        self.assertEqual(self.vm.cpu.fetch_instruction().instruction.name, "move.b")
+
+    def test_fused_runs_match_plain_ones(self):
+        plain = InstructionSet()
+        plain.fusions = {}
+        sources = [path.read_text() for path in sorted(EXAMPLES.rglob("*.bin"))] + [
+            "start: move.b #$5,d0\nloop: dec d0\n jnz loop\n halt",
+            "start: noop\nloop: dec a0\n cmp.b #$-3,a0\n jne loop\n halt",
+        ]
+
+        for source in sources:
+            with self.subTest(source=source):
+                states = []
+
+                for instruction_set in (plain, InstructionSet()):
+                    vm = VM(8, Clock(1, "unlimited"), 16, instruction_set)
+                    vm.boot(assemble(source))
+                    states.append(vm.run())
+
+                self.assertEqual(states[1], states[0])
+
+    def test_register_fusion(self):
+        class FusionMoveHalt(Fusion):
+            def __init__(self):
+                super().__init__("move.b", "halt")
+
+            def operands(self, entries, following):
+                return entries[0].operands
+
+            def execute(self, cpu, operands):
+                cpu.fusion_hits[self.opcode] += 1
+                cpu.dispatch[7](cpu, operands)
+                cpu.halt()
+
+        instruction_set = InstructionSet()
+        instruction_set.fuse(FusionMoveHalt())
+        self.assertGreater(instruction_set.opcodes[-1].opcode, 0xFF)
+
+        vm = VM(8, Clock(1, "unlimited"), 16, instruction_set)
+        vm.boot(assemble("start: move.b #$3,d0\n move.b #$4,d1\n halt"))
+        self.assertEqual(vm.cpu.decoded[3].instruction.name, "move.b+halt")
+
+        state = vm.run()
+        self.assertEqual((state.registers["d1"], state.cycles, state.reason), (4, 3, "halt"))
+        self.assertEqual(vm.cpu.fusions(), {"move.b+halt": 1})
+
+
+class FlagsTests(unittest.TestCase):
+    def test_result_is_resolved_when_read(self):
+        flags = Flags()
+        flags.load(V | C)
+        flags.set_result(-3, 4, 4)
+        self.assertIsNotNone(flags.pending)
+        self.assertTrue(flags.negative())
+        self.assertFalse(flags.zero())
+        self.assertEqual(flags.as_dict(), {"z": 0, "n": 1, "v": 0, "c": 0, "e": 1})
+        self.assertIsNone(flags.pending)
+
+    def test_step_keeps_overflow_and_carry(self):
+        flags = Flags()
+        flags.c = 1
+        flags.set_step(0)
+        flags.clear_overflow()
+        flags.set_step(0)
+        self.assertEqual(flags.as_dict(), {"z": 1, "n": 0, "v": 0, "c": 0, "e": 0})
+
+        flags.c = 1
+        flags.set_step(0)
+        self.assertEqual((flags.c, flags.z, flags.e), (1, 1, 0))
+        self.assertEqual(flags.ccr, 9)
+
+
+class InstructionSetTests(unittest.TestCase):
+    def test_instructions_are_immutable(self):
+        instruction = InstructionSet()["move.b"]
+
+        with self.assertRaises(AttributeError):
+            instruction.src = "d0"
+
+        self.assertEqual(instruction.assemble("5", "d0"), "0705d0")
+
+    def test_cycle_costs(self):
+        instruction_set = InstructionSet()
+        costs = {name: instruction_set[name].cycles for name in ["move.b", "mul.b", "div.b", "push", "jsr", "jmp"]}
+        self.assertEqual(costs, {"move.b": 1, "mul.b": 4, "div.b": 8, "push": 2, "jsr": 3, "jmp": 1})
+
+    def test_shared_instruction_set_across_threads(self):
+        instruction_set = InstructionSet()
+        vms = [VM(8, Clock(1, "unlimited"), 16, instruction_set) for _ in range(4)]
+
+        with tempfile.TemporaryDirectory() as directory:
+            for num, vm in enumerate(vms):
+                vm.boot(write_program(directory, [f"07{num + 3:02}d0", *LOOP_PROGRAM[1:]]))
+
+        threads = [threading.Thread(target=vm.run) for vm in vms]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        for vm in vms:
+            self.assertIs(vm.cpu.instruction_set, instruction_set)
+            self.assertEqual(vm.cpu.read_data_register("d0"), 0)
+
+
+class ProfilerTests(unittest.TestCase):
+    def setUp(self):
+        self.vm = VM(8, Clock(1, "unlimited"), 16)
+        self.directory = tempfile.TemporaryDirectory()
+        self.vm.boot(write_program(self.directory.name, LOOP_PROGRAM))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_profile_loop(self):
+        profiler = self.vm.cpu.profiler = Profiler()
+        state = self.vm.run()
+        report = profiler.report()
+
+        self.assertEqual(state.cycles, 44)
+        self.assertEqual(report["cycles"], 44)
+        self.assertEqual(report["opcodes"]["cmp.b"]["count"], 11)
+        self.assertEqual(report["opcodes"]["halt"]["count"], 1)
+        self.assertEqual(report["addresses"][0]["count"], 11)
+        self.assertEqual(sum(entry["count"] for entry in report["addresses"]), 44)
+
+    def test_folded_output(self):
+        profiler = self.vm.cpu.profiler = Profiler()
         self.vm.run()
+        lines = profiler.to_folded().splitlines()
+
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[1].startswith("cmp.b;0x0003 "))
+
+
+class JITTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_program(self, program, jit):
+        vm = VM(8, Clock(1, "unlimited"), 16)
+        vm.boot(program)
+
+        if jit:
+            vm.cpu.jit = JIT(vm.cpu)
+
+        return vm, vm.run()
+
+    def assertSameState(self, program):
+        _, interpreted = self.run_program(program, jit=False)
+        vm, translated = self.run_program(program, jit=True)
+        self.assertEqual(translated, interpreted)
+        return vm, translated
+
+    def test_examples_match_interpreter(self):
+        for source in sorted(EXAMPLES.rglob("*.bin")):
+            with self.subTest(source=source.name):
+                output = Path(self.directory.name) / f"{source.parent.name}-{source.name}.img"
+                compile_file(source, output, cache=None)
+                self.assertSameState(str(output))
+
+    def test_loop_is_translated(self):
+        vm, state = self.assertSameState(write_program(self.directory.name, LOOP_PROGRAM))
+        self.assertEqual(state.cycles, 44)
+        self.assertIn("while True:", vm.cpu.jit.blocks[3].source)
+
+    def test_division_by_zero_matches_interpreter(self):
+        vm, state = self.assertSameState(write_program(
+            self.directory.name, ["0707d0", "0302d0", "0101d0", "0300d0", "0d"]
+        ))
+        self.assertEqual(state.reason, "error")
+        self.assertEqual(state.program_counter, 9)
+
+    def test_branch_to_itself_loads_its_flag(self):
+        # The block at loop starts on a branch back to itself, so the loop reads E before anything sets it
+        _, state = self.assertSameState(assemble("start: cmp.b #$1,#$2\n jne loop\n halt\nloop: jeq loop\n halt"))
+        self.assertEqual((state.reason, state.program_counter), ("halt", 8))
+
+    def test_write_invalidates_block(self):
+        vm, _ = self.run_program(write_program(self.directory.name, LOOP_PROGRAM), jit=True)
+        self.assertIn(3, vm.cpu.jit.blocks)
+
+        vm.cpu.vram.write_byte(0, 10, 0x08)
+        self.assertNotIn(3, vm.cpu.jit.blocks)
+        self.assertIn(13, vm.cpu.jit.blocks)
+
+
+class StackTests(unittest.TestCase):
+    def setUp(self):
+        self.vm = VM(8, Clock(1, "unlimited"), 16)
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_subroutine(self):
+        output = Path(self.directory.name) / "stack.img"
+        compile_file(EXAMPLES / "stack" / "1.bin", output, cache=None)
+        self.vm.boot(str(output))
+        state = self.vm.run()
+
+        self.assertEqual(state.reason, "halt")
+        self.assertEqual(state.registers["d1"], 20)
+        self.assertEqual(state.stack_pointer, 0)
+
+    def test_overflow_is_a_halt_reason(self):
+        self.vm.cpu.stack = Stack(max_size=4)
+        self.vm.boot(write_program(self.directory.name, ["1100"]))
+        state = self.vm.run()
+
+        self.assertEqual(state.reason, "stack_overflow")
+        self.assertEqual(state.stack_pointer, 4)
+        # Four jsr of 3 cycles each got in before the fifth overflowed
+        self.assertEqual(state.cycles, 12)
+
+    def test_underflow_is_a_halt_reason(self):
+        self.vm.boot(write_program(self.directory.name, ["0f05", "10d0", "10d1", "0d"]))
+        state = self.vm.run()
+
+        self.assertEqual(state.reason, "stack_underflow")
+        self.assertEqual(state.registers["d0"], 5)
+        self.assertEqual(state.program_counter, 4)
+
+
+class SnapshotTests(unittest.TestCase):
+    def setUp(self):
+        self.vm = VM(8, Clock(1, "unlimited"), 64)
+        self.directory = tempfile.TemporaryDirectory()
+        self.vm.boot(write_program(self.directory.name, LOOP_PROGRAM))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_restore_reruns_program(self):
+        snapshot = self.vm.snapshot()
+        first = self.vm.run()
+        self.vm.restore(snapshot)
+        self.assertEqual(self.vm.cpu.program_counter, 0)
+        self.assertEqual(self.vm.cpu.read_data_register(0), 0)
+        self.assertEqual(self.vm.run(), first)
+
+    def test_restore_copies_only_written_pages(self):
+        snapshot = self.vm.snapshot()
+        self.vm.vram.write(0x210, 0x42)
+        self.vm.vram.write(0x211, 0x43)
+
+        written = []
+        self.vm.vram.watchers.append(lambda address, length: written.append((address, length)))
+        self.vm.restore(snapshot)
+
+        self.assertEqual(written, [(0x200, 256)])
+        self.assertEqual(self.vm.vram.read(0x210), 0)
+        self.assertIs(self.vm.vram.snapshot(), snapshot.pages)
+
+    def test_snapshots_share_unwritten_pages(self):
+        first = self.vm.snapshot()
+        self.vm.vram.write(0x300, 1)
+        second = self.vm.snapshot()
+
+        self.assertIs(first.pages[0], second.pages[0])
+        self.assertIsNot(first.pages[3], second.pages[3])
+
+        self.vm.restore(first)
+        self.assertEqual(self.vm.vram.read(0x300), 0)
+        self.vm.restore(second)
+        self.assertEqual(self.vm.vram.read(0x300), 1)
+
+    def test_fork(self):
+        snapshot = self.vm.snapshot()
+        children = [self.vm.fork(snapshot) for _ in range(3)]
+        children[0].vram.write(0x100, 7)
+
+        self.assertEqual([child.vram.read(0x100) for child in children], [7, 0, 0])
+        self.assertEqual([child.run().cycles for child in children], [44, 44, 44])
+        self.assertEqual(self.vm.cpu.cycles, 0)
+
+
+class VRAMTests(unittest.TestCase):
+    def test_read_write(self):
+        vram = VRAM(16)
+        vram.write(0x21, 7)
+        vram.write("0x22", -1)
+        self.assertEqual(vram.read(0x21), 7)
+        self.assertEqual(vram.read_byte(2, 2), 0xFF)
+        self.assertEqual(list(vram.offset(2)[:3]), [0, 7, 0xFF])
+
+    def test_megabyte_memory(self):
+        vram = VRAM(VRAM.MB_SIZE // VRAM.BASE_SIZE)
+        vram.write(len(vram) - 1, 1)
+        self.assertEqual(str(vram), "Memory: 1 megabyte(s)")
+        self.assertEqual(vram.read(len(vram) - 1), 1)
+
+    def test_bulk_read_write(self):
+        vram = VRAM(4096)
+        written = []
+        vram.watchers.append(lambda address, length: written.append((address, length)))
+
+        vram.write_bytes(0, bytes(range(256)) * 256)
+        self.assertEqual(written, [(0, 65536)])
+
+        view = vram.read_bytes(0x100, 4)
+        self.assertIsInstance(view, memoryview)
+        self.assertEqual(bytes(view), bytes([0, 1, 2, 3]))
+
+        vram.write(0x101, 0x42)
+        self.assertEqual(view[1], 0x42)
+
+        with self.assertRaises(TypeError):
+            view[1] = 9
+
+        self.assertTrue(view.readonly)
+
+    def test_bulk_access_out_of_range(self):
+        vram = VRAM(1)
+
+        with self.assertRaises(IndexError):
+            vram.write_bytes(8, bytes(16))
+
+        with self.assertRaises(IndexError):
+            vram.read_bytes(8, 16)
+
+        self.assertEqual(len(vram), 16)
+
+    def test_program_is_stored_as_bytes(self):
+        vm = VM(8, Clock(1, "unlimited"), 16)
+
+        with tempfile.TemporaryDirectory() as directory:
+            vm.boot(write_program(directory, ["07-1d0", "0e00a1", "0b13"]))
+
+        self.assertEqual(list(vm.vram.offset(0)[:8]), [0x07, 0xFF, 0xD0, 0x0E, 0x00, 0xA1, 0x0B, 13])
+        self.assertEqual(vm.cpu.decoded[0].operands, ((0, -1), (1, 0)))
+        self.assertEqual(vm.cpu.plain(3).operands, ((0, 0), (2, 1)))
+
+
+class MappedVRAMTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name) / "memory.bin"
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_memory_persists_after_run(self):
+        vm = VM(8, Clock(1, "unlimited"), MappedVRAM(self.path, 16))
+        vm.boot(write_program(self.directory.name, MOVE_PROGRAM))
+        state = vm.run()
+        vm.close()
+
+        self.assertEqual(state.registers["d7"], 8)
+        self.assertEqual(self.path.stat().st_size, 256)
+        self.assertEqual(self.path.read_bytes()[:3], bytes([0x07, 0x01, 0xD0]))
+
+        vram = MappedVRAM(self.path)
+        self.assertEqual(vram.size, 16)
+        self.assertEqual(vram.read_byte(0, 1), 1)
+        vram.close()
+
+    def test_private_mapping_leaves_file_alone(self):
+        self.path.write_bytes(bytes(256))
+        vram = MappedVRAM(self.path, private=True)
+        vram.write(0x10, 0x42)
+        self.assertEqual(vram.read(0x10), 0x42)
+        vram.close()
+
+        self.assertEqual(self.path.read_bytes(), bytes(256))
+
+    def test_private_mapping_needs_whole_file(self):
+        self.path.write_bytes(bytes(16))
+
+        with self.assertRaises(ValueError):
+            MappedVRAM(self.path, 16, private=True)
+
+
+class ImageTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.vm = VM(8, Clock(1, "unlimited"), 16)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_boot_image(self):
+        path = Path(self.directory.name) / "program.img"
+        write_image(path, 3, [(3, bytes([0x07, 5, 0xD1, 0x0D])), (0x20, bytes([1, 2]))])
+        self.vm.boot(path)
+
+        self.assertEqual(self.vm.cpu.start, 3)
+        self.assertEqual(self.vm.vram.read(0x21), 2)
+        self.assertEqual(self.vm.cpu.decoded[3].operands, ((0, 5), (1, 1)))
+
+        self.assertEqual(self.vm.run().registers["d1"], 5)
+
+    def test_segment_at_the_last_address(self):
+        # 0x01 is add.b, whose operands would be past the end of memory
+        path = Path(self.directory.name) / "program.img"
+        write_image(path, 0, [(0, bytes([0x07, 5, 0xD0, 0x0D])), (255, bytes([0x01]))])
+        self.vm.boot(path)
+
+        self.assertNotIn(255, self.vm.cpu.decoded)
+        self.assertEqual(self.vm.vram.read(255), 1)
+        self.assertEqual(self.vm.run().registers["d0"], 5)
+
+    def test_read_image_rejects_bad_magic(self):
+        with self.assertRaises(ImageError):
+            read_image(b"NOPE" + bytes(8))
+
+    def test_compiler_emits_image(self):
+        source = Path(self.directory.name) / "loop.bin"
+        output = Path(self.directory.name) / "loop.out"
+        source.write_text(EXAMPLES.joinpath("loops", "1.bin").read_text())
+
+        result = CliRunner().invoke(compile_program, ["--input", str(source), "--output", str(output), "--no-cache"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.vm.boot(output)
+
+        self.assertEqual(self.vm.run().registers["d0"], 0)
+        self.assertEqual(bytes(self.vm.vram.offset(0)[:6]), bytes([0x07, 10, 0xD0, 0x0E, 0, 0xD0]))
+
+
+class CompilerCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = Path(self.directory.name)
+        self.cache = self.root / "cache"
+        self.source = self.root / "loop.bin"
+        self.source.write_text(EXAMPLES.joinpath("loops", "1.bin").read_text())
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_unchanged_source_is_skipped(self):
+        output = self.root / "loop.out"
+        self.assertTrue(compile_file(self.source, output, cache=self.cache))
+        self.assertEqual(len(list(self.cache.iterdir())), 1)
+        self.assertFalse(compile_file(self.source, output, cache=self.cache))
+
+        self.source.write_text(self.source.read_text().replace("#$10", "#$12"))
+        self.assertTrue(compile_file(self.source, output, cache=self.cache))
+        self.assertEqual(len(list(self.cache.iterdir())), 2)
+
+    def test_cached_output_matches_compiled_output(self):
+        cached, uncached = self.root / "cached.out", self.root / "uncached.out"
+        compile_file(self.source, self.root / "first.out", cache=self.cache)
+        compile_file(self.source, cached, cache=self.cache)
+        compile_file(self.source, uncached, cache=None)
+        self.assertEqual(cached.read_bytes(), uncached.read_bytes())
+
+    def test_compile_directory(self):
+        self.root.joinpath("bad.bin").write_text("start: bogus d0\n")
+        results = compile_directory(self.root, cache=self.cache, jobs=2)
+
+        self.assertEqual([Path(path).name for path, _, _ in results], ["bad.bin", "loop.bin"])
+        self.assertIn("bogus", results[0][2])
+        self.assertTrue(results[1][1])
+        self.assertTrue(self.root.joinpath("loop.bin.out").exists())
+        self.assertFalse(compile_directory(self.root, cache=self.cache)[1][1])
+
+    def test_undefined_label(self):
+        self.source.write_text("start: jmp nowhere\n")
+
+        with self.assertRaises(CompileError):
+            compile_file(self.source, self.root / "out", cache=None)
+
+
+class AssemblerTests(unittest.TestCase):
+    def test_forward_references_are_fixed_up(self):
+        start, assembler = assemble_lines([
+            "start:  jmp   main      ; skip the subroutine",
+            "double: add.b d0, d0",
+            "        rts",
+            "",
+            "; the program proper",
+            "main:",
+            "        move.b #$5,d0",
+            "        jsr double",
+            "        halt",
+        ], listing=True)
+
+        self.assertEqual(start, 0)
+        self.assertEqual(assembler.labels["main"], 6)
+        self.assertEqual(bytes(assembler.code[:2]), bytes([0x08, 6]))
+        self.assertEqual(bytes(assembler.code[9:11]), bytes([0x11, 2]))
+        self.assertEqual(assembler.listing[0][1], [6])
+
+    def test_line_numbers_count_comments_and_blanks(self):
+        with self.assertRaisesRegex(CompileError, "line 3: 'move.b' takes 2 operand"):
+            assemble_lines(["; comment", "", "start: move.b d0"])
+
+        with self.assertRaisesRegex(CompileError, "line 2: 'nowhere'"):
+            assemble_lines(["start: noop", "       jmp nowhere"])
+
+    def test_boot_assembled_program(self):
+        program = assemble(EXAMPLES.joinpath("stack", "1.bin").read_text())
+        self.assertEqual(program.symbols, {"start": 0, "double": 12})
+        self.assertEqual(program.entry, 0)
+        self.assertEqual(program.code[:3], bytes([0x07, 5, 0xD0]))
+
+        vm = VM(8, Clock(1, "unlimited"), 16)
+        vm.boot(program)
+        state = vm.run()
+        self.assertEqual(state.reason, "halt")
+        self.assertEqual(state.registers["d1"], 20)
+
+    def test_text_format_operands_fit_two_characters(self):
+        for source in [["start: jmp far", *["noop"] * 121, "far: halt"], ["start: move.b #$-10,d0", "halt"]]:
+            with self.subTest(source=source[0]):
+                with self.assertRaisesRegex(CompileError, "too wide for the text format"):
+                    assemble_lines(source, listing=True)
+
+                # The binary format holds them
+                assemble_lines(source)
+
+        with tempfile.TemporaryDirectory() as directory, self.assertRaises(ValueError):
+            VM(8, Clock(1, "unlimited"), 16).boot(write_program(directory, ["08122", "0d"]))
+
+    def test_label_out_of_operand_range(self):
+        with self.assertRaisesRegex(CompileError, "Range error"):
+            assemble_lines(["start: jmp end", *["noop"] * 256, "end: halt"])
+
+    def test_immediates_that_read_back_as_registers(self):
+        for operand in ["#$-48", "#$-33", "#$-96", "#$-81", "#$128", "#$-129", "#$200", "d16", "a16", "d-1"]:
+            with self.subTest(operand=operand):
+                with self.assertRaisesRegex(CompileError, f"Range error on line 1: '{re.escape(operand)}'"):
+                    assemble(f"start: move.b {operand},d1\n halt")
+
+        for value in [-128, -97, -80, -49, -32, 127]:
+            with self.subTest(value=value):
+                vm = VM(8, Clock(1, "unlimited"), 16)
+                vm.boot(assemble(f"start: move.b #${value},d1\n move.b d1,a15\n halt"))
+                self.assertEqual(vm.run().registers["d1"], value)
+
+    def test_optimize_threads_jumps_and_drops_dead_code(self):
+        start, assembler = assemble_lines([
+            "start:  jmp   first",
+            "first:  jmp   second     ; threaded, then falls through to second",
+            "second: move.b #$1,d0    ; overwritten below before anything reads it",
+            "        noop",
+            "        move.b #$3,d0",
+            "loop:   sub.b #$1,d0",
+            "        cmp.b #$0,d0     ; sub.b already left Z and N from d0",
+            "        jnz   loop",
+            "        move.b #$7,d1    ; sets the flags halt shows",
+            "        halt",
+        ], optimize=True)
+
+        self.assertEqual(assembler.optimizer.threaded, 1)
+        self.assertEqual(assembler.optimizer.removed, 5)
+        self.assertEqual(start, 0)
+        self.assertEqual(assembler.labels, {"start": 0, "first": 0, "second": 0, "loop": 3})
+        self.assertEqual(bytes(assembler.code), bytes([0x07, 3, 0xD0, 0x01, 1, 0xD0, 0x0A, 3, 0x07, 7, 0xD1, 0x0D]))
+
+    def test_optimize_keeps_what_is_read(self):
+        source = [
+            "start:  move.b #$1,d0",
+            "        move.b #$2,d0    ; sets E from the old d0, which jeq reads",
+            "        jeq   done",
+            "        sub.b #$1,d1",
+            "        cmp.b #$0,d1     ; E differs from what sub.b left, and jne reads it",
+            "        jne   done",
+            "        move.b #$7,d2",
+            "done:   halt",
+        ]
+        self.assertEqual(assemble(source, optimize=True).code, assemble(source).code)
+
+    def test_optimize_examples(self):
+        # Registers, flags and how the program stopped are the same, in no more cycles, including when
+        # it stops on a fault or a stack error with a store still to be overwritten
+        sources = [path.read_text() for path in sorted(EXAMPLES.rglob("*.bin"))] + [
+            "start: move.b #$7,d0\n div.b d1,d2\n move.b #$5,d0\n halt",
+            "start: move.b #$7,d0\n pop d1\n move.b #$5,d0\n halt",
+            "start: move.b #$1,d0\n push d1\n move.b #$2,d0\n jmp start",
+            "start: move.b #$5,d0\n cmp.b #$5,d0\n halt",
+        ]
+
+        for source in sources:
+            with self.subTest(source=source):
+                states = []
+
+                for optimize in (False, True):
+                    vm = VM(8, Clock(1, "unlimited"), 16)
+                    vm.boot(assemble(source, optimize=optimize))
+                    states.append(vm.run())
+
+                plain, optimized = states
+                self.assertEqual(optimized.registers, plain.registers)
+                self.assertEqual(optimized.address_registers, plain.address_registers)
+                self.assertEqual(optimized.flags, plain.flags)
+                self.assertEqual(optimized.reason, plain.reason)
+                self.assertLessEqual(optimized.cycles, plain.cycles)
+
+
+class BatchTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.programs = []
+
+        for num in range(3):
+            path = Path(self.directory.name) / f"{num}.img"
+            write_image(path, 0, [(0, bytes([0x07, num + 1, 0xD0, 0x0D]))])
+            self.programs.append(str(path))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_run_program(self):
+        result = run_program(self.programs[1])
+        self.assertEqual(result["reason"], "halt")
+        self.assertEqual(result["cycles"], 2)
+        self.assertEqual(result["registers"]["d0"], 2)
+        self.assertEqual(result["program_counter"], 3)
+
+    def test_run_program_reports_errors(self):
+        path = Path(self.directory.name) / "bad.img"
+        write_image(path, 0, [(0, bytes([0xFF]))])
+        result = run_program(str(path))
+        self.assertEqual(result["reason"], "error")
+
+    def test_boot_leaves_output_to_the_reporter(self):
+        vm = VM(8, Clock(1, "unlimited"), 16)
+        output = io.StringIO()
+
+        with contextlib.redirect_stdout(output):
+            vm.boot(self.programs[0])
+
+        self.assertEqual(output.getvalue(), "")
+
+        with contextlib.redirect_stdout(output):
+            REPORTERS["table"]().booted(vm)
+
+        self.assertEqual(output.getvalue(), "Loaded 4 byte(s) in 1 segment(s)\n")
+
+    def test_run_batch(self):
+        results = run_batch(self.programs, workers=2)
+        self.assertEqual([result["registers"]["d0"] for result in results], [1, 2, 3])
+
+
+class SchedulerTests(unittest.TestCase):
+    def vm(self, speed=1, magnitude="unlimited", count=5):
+        vm = VM(8, Clock(speed, magnitude), 16)
+        vm.boot(assemble(f"start: move.b #${count},d0\nloop: dec d0\n jnz loop\n move.b #$7,d1\n halt"))
+        return vm
+
+    def test_run_slice(self):
+        vm = self.vm()
+        # dec and jnz are fused, so a slice can end one instruction past its budget
+        self.assertEqual(vm.run_slice(4), 5)
+        self.assertFalse(vm.cpu.stop)
+        self.assertEqual(vm.run_slice(100), 8)
+        self.assertEqual((vm.cpu.reason, vm.cpu.cycles), ("halt", 13))
+
+    def test_run_all_matches_run(self):
+        vms = [self.vm(count=count) for count in (3, 40, 1)]
+        states = run_all(vms, slice=7)
+        expected = self.vm(count=40).run()
+
+        self.assertEqual([state.cycles for state in states], [9, 83, 5])
+        self.assertEqual(states[1], expected)
+
+    def test_paced_vms_keep_their_clock(self):
+        async def main():
+            scheduler = Scheduler()
+            slow = scheduler.submit(self.vm(4, "hz"))
+            started = time.perf_counter()
+            fast = await scheduler.submit(self.vm(2, "khz", 20))
+            elapsed = time.perf_counter() - started
+
+            self.assertFalse(slow.done())
+            slow.cancel()
+
+            with self.assertRaises(asyncio.CancelledError):
+                await slow
+
+            return fast, elapsed
+
+        state, elapsed = asyncio.run(main())
+        self.assertEqual(state.reason, "halt")
+        # 43 instructions at 2 kHz
+        self.assertGreaterEqual(elapsed, 0.02)
+
+    def test_faults_end_the_task(self):
+        vm = VM(8, Clock(1, "unlimited"), 16)
+        vm.boot(assemble("start: move.b #$0,d0\n div.b d0,d1\n halt"))
+        state, = run_all([vm])
+        self.assertEqual(state.reason, "error")
+        self.assertTrue(state.error.startswith("ZeroDivisionError"))
+
+        # A stack error stops a sliced run just as it does a full one
+        vms = [VM(8, Clock(1, "unlimited"), 16) for _ in range(2)]
+
+        for vm in vms:
+            vm.boot(assemble("start: pop d0\n halt"))
+
+        state, = run_all(vms[:1])
+        self.assertEqual(state, vms[1].run())
+        self.assertEqual(state.reason, "stack_underflow")
 
 
 if __name__ == '__main__':